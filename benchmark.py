@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+
+"""Benchmark the stages of the eradicate pipeline."""
+
+import io
+import json
+import os
+import platform
+import random
+import sys
+import sysconfig
+import time
+import tokenize
+
+import eradicate
+
+
+STAGES = ('decode', 'tokenize', 'classify', 'find', 'filter', 'diff',
+          'total')
+
+CODE_LINES = (
+    'x = foo(1, 2)',
+    'return {"key": value}',
+    'for item in items:',
+    '    total += item.price * item.quantity',
+    'if self.enabled and not self.closed:',
+    'result = [transform(x) for x in values if x]',
+    'import os',
+    'print("done")',
+)
+
+PROSE_COMMENTS = (
+    '# This is a real comment.',
+    '# See foo(bar) for details.',
+    '# TODO: Handle the empty case.',
+    '# Note: this is = to that in most cases.',
+    '# Issue #999: Not code.',
+    '# The value is computed lazily (see below).',
+    '# noqa',
+    '#',
+)
+
+CODE_COMMENTS = (
+    '# x = 1',
+    '# print(x)',
+    '#return True',
+    '# foo(1, 2, 3)',
+    '# else:',
+    '# import os',
+    '#     self.value = value',
+    '# }',
+)
+
+# Formatted with a line number, so that every comment is distinct.
+SCALING_COMMENTS = (
+    '# x{0} = foo({0})',
+    '# elif x{0}:',
+    '# except Error{0}:',
+    '# print(x{0})',
+    '# if x{0} > 0:',
+    '# The value {0} is computed lazily.',
+)
+
+SCALING_LINES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+
+
+def synthetic_source(rng, lines, comment_ratio, code_comment_ratio):
+    """Return synthetic source with the given share of comments."""
+    result = []
+    for _ in range(lines):
+        if rng.random() < comment_ratio:
+            if rng.random() < code_comment_ratio:
+                result.append(rng.choice(CODE_COMMENTS))
+            else:
+                result.append(rng.choice(PROSE_COMMENTS))
+        else:
+            result.append(rng.choice(CODE_LINES))
+    return '\n'.join(result) + '\n'
+
+
+def generated_source(rng, lines):
+    """Return source resembling generated protobuf or ORM modules."""
+    result = ['# Generated by the protocol buffer compiler.  DO NOT EDIT!',
+              '# source: example.proto', '']
+    for number in range(lines):
+        result.append(
+            f'_FIELD_{number} = _descriptor.FieldDescriptor('
+            f'name="field_{number}", index={number}, '
+            f'number={rng.randrange(1, 536870911)}, type=9, '
+            f'default_value=b"".decode("utf-8"))')
+    return '\n'.join(result) + '\n'
+
+
+def synthetic_corpora(scale=1.0):
+    """Return dictionary of synthetic corpora as lists of (name, bytes)."""
+    rng = random.Random(0)
+
+    def count(number):
+        return max(1, int(number * scale))
+
+    return {
+        'small': [
+            (f'small_{i}.py',
+             synthetic_source(rng, count(50), 0.2, 0.2).encode())
+            for i in range(count(200))],
+        'large': [
+            (f'large_{i}.py',
+             synthetic_source(rng, count(50000), 0.2, 0.2).encode())
+            for i in range(2)],
+        'comments': [
+            (f'comments_{i}.py',
+             synthetic_source(rng, count(2000), 0.7, 0.3).encode())
+            for i in range(count(20))],
+        'generated': [
+            (f'generated_{i}.py', generated_source(rng, count(20000)).encode())
+            for i in range(count(5))],
+    }
+
+
+def scaling_source(lines):
+    """Return source of lines lines, half of them distinct comments.
+
+    Most comments are code, among them code keywords, so that the time of
+    filtering and classifying grows with the number of lines rather than
+    being absorbed by the memo.
+    """
+    result = []
+    for number in range(lines):
+        if number % 2:
+            result.append(SCALING_COMMENTS[
+                number // 2 % len(SCALING_COMMENTS)].format(number))
+        else:
+            result.append(f'x{number} = foo({number})')
+    return '\n'.join(result) + '\n'
+
+
+def scaling_corpora():
+    """Return dictionary of corpora of one file of each of SCALING_LINES."""
+    return {
+        f'scaling-{size}': [
+            (f'scaling_{lines}.py', scaling_source(lines).encode())]
+        for size, lines in SCALING_LINES.items()}
+
+
+def directory_corpus(directory, limit=None):
+    """Return list of (name, bytes) of Python files below directory."""
+    corpus = []
+    for root, directories, children in os.walk(directory):
+        directories[:] = sorted(d for d in directories
+                                if not d.startswith('.') and
+                                d not in ('site-packages', '__pycache__'))
+        for child in sorted(children):
+            if child.endswith('.py'):
+                with open(os.path.join(root, child), 'rb') as input_file:
+                    corpus.append((os.path.join(root, child),
+                                   input_file.read()))
+                if limit is not None and len(corpus) >= limit:
+                    return corpus
+    return corpus
+
+
+def best_time(function, repeat):
+    """Return the best wall time of repeated calls to function."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_corpus(corpus, aggressive, repeat):
+    """Return timings of each stage over corpus."""
+    eradicator = eradicate.Eradicator()
+    sources = [eradicator.decode(data)[0] for _, data in corpus]
+    comments = [
+        [token[4] for token in tokenize.generate_tokens(
+            io.StringIO(source).readline)
+         if token[0] == tokenize.COMMENT]
+        for source in sources]
+    marked = [list(eradicator.commented_out_code_line_numbers(source,
+                                                              aggressive))
+              for source in sources]
+
+    def decode():
+        for _, data in corpus:
+            eradicator.decode(data)
+
+    def tokenize_sources():
+        for source in sources:
+            for _ in tokenize.generate_tokens(io.StringIO(source).readline):
+                pass
+
+    def classify():
+        # Use a fresh memo so that every repetition does the same work.
+        classifier = eradicate.Eradicator()
+        for lines in comments:
+            for line in lines:
+                classifier.comment_contains_code(line, aggressive)
+
+    def find():
+        finder = eradicate.Eradicator()
+        for source in sources:
+            for _ in finder.commented_out_code_line_numbers(source,
+                                                            aggressive):
+                pass
+
+    def filter_sources():
+        for source, lines in zip(sources, marked):
+            ''.join(eradicator.filter_commented_out_code(
+                source, aggressive, marked_lines=lines))
+
+    def diff():
+        output = io.StringIO()
+        for (name, _), source, lines in zip(corpus, sources, marked):
+            eradicator.write_diff(source, lines, name, output)
+
+    def total():
+        runner = eradicate.Eradicator()
+        output = io.StringIO()
+        for name, data in corpus:
+            source = runner.decode(data)[0]
+            runner.write_diff(
+                source, runner.commented_out_code_line_numbers(source,
+                                                               aggressive),
+                name, output)
+
+    stages = {
+        'decode': decode,
+        'tokenize': tokenize_sources,
+        'classify': classify,
+        'find': find,
+        'filter': filter_sources,
+        'diff': diff,
+        'total': total,
+    }
+    timings = {stage: best_time(stages[stage], repeat) for stage in STAGES}
+
+    lines = sum(source.count('\n') for source in sources)
+    comment_count = sum(len(c) for c in comments)
+    return {
+        'files': len(corpus),
+        'lines': lines,
+        'comments': comment_count,
+        'marked': sum(len(m) for m in marked),
+        'stages': timings,
+        'files_per_second': len(corpus) / timings['total'],
+        'lines_per_second': lines / timings['total'],
+        'seconds_per_comment': timings['classify'] / max(1, comment_count),
+    }
+
+
+def compare(baseline, results, threshold):
+    """Return list of stages that are slower than baseline by threshold."""
+    regressions = []
+    for name, corpus in results['corpora'].items():
+        baseline_corpus = baseline['corpora'].get(name)
+        if baseline_corpus is None:
+            continue
+        for stage, seconds in corpus['stages'].items():
+            before = baseline_corpus['stages'].get(stage)
+            if before and seconds > before * (1 + threshold):
+                regressions.append((name, stage, before, seconds))
+    return regressions
+
+
+def format_results(results):
+    """Return results as a text table."""
+    lines = ['{:<13} {:>6} {:>9} {:>9} {:>11} {:>10}  {}'.format(
+        'corpus', 'files', 'lines', 'files/s', 'lines/s', 'us/comment',
+        '  '.join(f'{stage:>8}' for stage in STAGES))]
+    for name, corpus in results['corpora'].items():
+        lines.append(
+            '{:<13} {:>6} {:>9} {:>9.0f} {:>11.0f} {:>10.2f}  {}'.format(
+                name, corpus['files'], corpus['lines'],
+                corpus['files_per_second'], corpus['lines_per_second'],
+                corpus['seconds_per_comment'] * 1e6,
+                '  '.join(f'{corpus["stages"][stage]:>8.4f}'
+                          for stage in STAGES)))
+    return '\n'.join(lines)
+
+
+def main(argv=sys.argv, standard_out=sys.stdout):
+    """Run the benchmarks and print or save their results."""
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--corpus', action='append', default=[],
+                        choices=['small', 'large', 'comments', 'generated',
+                                 'stdlib', 'scaling'],
+                        help='corpus to run (default: all synthetic '
+                             'corpora and the standard library); scaling '
+                             'runs single files of 1k to 1M lines, not '
+                             'affected by --scale')
+    parser.add_argument('--directory', action='append', default=[],
+                        help='also run on the Python files of a directory')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='scale the size of synthetic corpora')
+    parser.add_argument('--limit', type=int, default=1000,
+                        help='maximum number of files taken from a '
+                             'directory (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of repetitions of which the best is '
+                             'kept (default: %(default)s)')
+    parser.add_argument('-a', '--aggressive', action='store_true',
+                        help='benchmark aggressive mode')
+    parser.add_argument('--output',
+                        help='save results as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='compare with JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='fail if a stage is slower than in the '
+                             'baseline by more than this fraction '
+                             '(default: %(default)s)')
+    args = parser.parse_args(argv[1:])
+
+    selected = args.corpus or ['small', 'large', 'comments', 'generated',
+                               'stdlib']
+    corpora = {name: corpus
+               for name, corpus in synthetic_corpora(args.scale).items()
+               if name in selected}
+    if 'stdlib' in selected:
+        corpora['stdlib'] = directory_corpus(sysconfig.get_paths()['stdlib'],
+                                             limit=args.limit)
+    if 'scaling' in selected:
+        corpora.update(scaling_corpora())
+    for directory in args.directory:
+        corpora[directory] = directory_corpus(directory, limit=args.limit)
+
+    results = {
+        'eradicate': eradicate.__version__,
+        'python': (platform.python_implementation() + ' ' +
+                   platform.python_version()),
+        'aggressive': args.aggressive,
+        'corpora': {name: benchmark_corpus(corpus, args.aggressive,
+                                           args.repeat)
+                    for name, corpus in corpora.items()},
+    }
+
+    print(format_results(results), file=standard_out)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as input_file:
+            baseline = json.load(input_file)
+        regressions = compare(baseline, results, args.threshold)
+        for name, stage, before, after in regressions:
+            print(f'{name}: {stage} regressed from {before:.4f}s '
+                  f'to {after:.4f}s', file=standard_out)
+        if regressions:
+            return 1
+
+    return None
+
+
+if __name__ == '__main__':
+    sys.exit(main())
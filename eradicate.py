@@ -21,16 +21,40 @@
 
 """Removes commented-out Python code."""
 
-import difflib
+import collections
+import codecs
+import contextlib
+import fnmatch
+import functools
+import heapq
 import io
+import json
+import keyword
 import os
+import random
 import sys
 import re
+import stat
+import time
 import tokenize
+import warnings
 
 __version__ = '3.0.1'
 
 
+def rejection_regex(whitelist_pattern):
+    """Return regex matching comments rejected before checking for code.
+
+    It combines whitelist_pattern with the hash number and coding comment
+    checks. The whitelist comes first so that its group numbers and global
+    flags keep their meaning.
+    """
+    return re.compile(
+        whitelist_pattern +
+        r'|\#[0-9]|(?-i:^[^\n]*?coding[:=][ \t]*[-_.a-zA-Z0-9])',
+        flags=re.IGNORECASE)
+
+
 class Eradicator:
     """Eradicate comments."""
     BRACKET_REGEX = re.compile(r'^[()\[\]{}\s]+$')
@@ -41,11 +65,27 @@ class Eradicator:
     MULTILINE_ASSIGNMENT_REGEX = re.compile(r'^\s*\w+\s*=.*[(\[{]$')
     PARTIAL_DICTIONARY_REGEX = re.compile(r'^\s*[\'"]\w+[\'"]\s*:.+[,{]\s*$')
     PRINT_RETURN_REGEX = re.compile(r'^(print|return)\b\s*')
+    # Two names separated by whitespace, for example "that works".
+    ADJACENT_NAMES_REGEX = re.compile(
+        r'(?<!\w)([^\W\d]\w*)\s+(?=([^\W\d]\w*))')
     WITH_STATEMENT_REGEX = re.compile(r"with .+ as [a-zA-Z_][a-zA-Z0-9_]*:$")
     INLINE_SCRIPT_METADATA = re.compile(r'(?m)^# /// (?P<type>[a-zA-Z0-9-]+)$\s(?P<content>(^#(| .*)$\s)+)^# ///$')
 
     CODE_INDICATORS = ['(', ')', '[', ']', '{', '}', ':', '=', '%',
                        'print', 'return', 'break', 'continue', 'import']
+    # Finds any code indicator in a single scan. Comments without one cannot
+    # contain code.
+    CODE_INDICATOR_REGEX = re.compile(
+        r'|'.join(re.escape(symbol) for symbol in CODE_INDICATORS))
+    # Matches comments that contain any code indicator. Files without a
+    # match cannot contain commented-out code.
+    CODE_INDICATORS_REGEX = re.compile(
+        r'#[^\n]*?(?:' + CODE_INDICATOR_REGEX.pattern + r')')
+    # The same for memory-mapped bytes of ASCII compatible encodings.
+    CODE_INDICATORS_BYTES_REGEX = re.compile(
+        CODE_INDICATORS_REGEX.pattern.encode())
+    INLINE_SCRIPT_METADATA_BYTES = re.compile(
+        INLINE_SCRIPT_METADATA.pattern.encode())
     CODE_KEYWORDS = [r'elif\s+.*', 'else', 'try', 'finally', r'except\s+.*']
     CODE_KEYWORDS_AGGR = CODE_KEYWORDS + [r'if\s+.*']
     WHITESPACE_HASH = ' \t\v\n#'
@@ -64,52 +104,198 @@ class Eradicator:
         r'FIXME',
         r'XXX'
     )
-    WHITELIST_REGEX = re.compile(r'|'.join(DEFAULT_WHITELIST), flags=re.IGNORECASE)
 
-    def comment_contains_code(self, line, aggressive=True):
+    # Decisions of classify_comment() that mean a comment contains code.
+    CODE_DECISIONS = frozenset(['multiline', 'keyword', 'partial-dictionary',
+                                'compile'])
+
+    # Files of at least this many bytes are memory-mapped instead of read.
+    LARGE_FILE_SIZE = 16 * 1024 * 1024
+
+    # Optional ResultCache of commented-out code line numbers.
+    cache = None
+
+    # Optional Statistics collected while checking.
+    stats = None
+
+    # Optional Report to which findings are written instead of diffs.
+    report = None
+
+    def __init__(self, memo_size=4096, config=None):
+        self._memo_size = memo_size
+        self.configure(Config() if config is None else config)
+
+    def configure(self, config):
+        """Check with config from now on.
+
+        The configuration, its compiled patterns and the memo of decisions
+        are swapped in a single assignment. So one Eradicator can be shared
+        by threads without locks: calls that are running keep using the
+        previous configuration.
+        """
+        patterns = compile_config(config)
+        # Memo of decisions keyed on normalized comment text and aggressive.
+        memo = functools.lru_cache(maxsize=self._memo_size)(
+            functools.partial(self._classify, patterns))
+        self._state = _State(config, patterns, memo)
+
+    @property
+    def config(self):
+        """Return the Config in use."""
+        return self._state.config
+
+    @property
+    def WHITELIST_REGEX(self):
+        """Return compiled whitelist of the Config in use."""
+        return self._state.patterns.whitelist
+
+    @property
+    def REJECTION_REGEX(self):
+        """Return rejection_regex() of the Config in use."""
+        return self._state.patterns.rejection
+
+    def __getstate__(self):
+        # The memo cannot be pickled, so a copy starts with an empty one.
+        state = self.__dict__.copy()
+        state['_state'] = self._state.config
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.configure(state['_state'])
+
+    def comment_contains_code(self, line, aggressive=None):
         """Return True comment contains code."""
+        # Most comments have no code indicator and need no other check.
+        if self.stats is None and not self.CODE_INDICATOR_REGEX.search(line):
+            return False
+        return self.classify_comment(line, aggressive) in self.CODE_DECISIONS
+
+    def classify_comment(self, line, aggressive=None):
+        """Return name of the decision that classifies a comment.
+
+        The comment contains code if the decision is in CODE_DECISIONS. If
+        aggressive is None, that of the Config is used.
+        """
+        if self.stats is None or not line.lstrip().startswith('#'):
+            return self._decide(line, aggressive)
+
+        hits = self._state.memo.cache_info().hits
+        with self.stats.timer('classify'):
+            decision = self._decide(line, aggressive)
+        self.stats.count(decision)
+        if self._state.memo.cache_info().hits != hits:
+            self.stats.count('memo-hit')
+        return decision
+
+    def _decide(self, line, aggressive):
+        """Return decision of classify_comment() without counting it."""
         line = line.lstrip()
         if not line.startswith('#'):
-            return False
+            return 'not-comment'
+
+        state = self._state
+        if aggressive is None:
+            aggressive = state.config.aggressive
+        return state.memo(line.lstrip(self.WHITESPACE_HASH).strip(),
+                          aggressive)
+
+    def classify_comments(self, lines, aggressive=None):
+        """Return list telling for each comment line if it contains code.
 
-        line = line.lstrip(self.WHITESPACE_HASH).strip()
+        Identical comments are classified once. Comments without a code
+        indicator are decided first, with a single scan. Whitelisted, hash
+        number and coding comments are then rejected with a single combined
+        regex, and only the remaining comments are fully classified.
+        """
+        if self.stats is not None:
+            return [self.comment_contains_code(line, aggressive)
+                    for line in lines]
 
+        state = self._state
+        if aggressive is None:
+            aggressive = state.config.aggressive
+        normalized_lines = []
+        for line in lines:
+            line = line.lstrip()
+            normalized_lines.append(
+                line.lstrip(self.WHITESPACE_HASH).strip()
+                if line.startswith('#') else None)
+
+        indicated = self.CODE_INDICATOR_REGEX.search
+        rejected = state.patterns.rejection.search
+        verdicts = {None: False}
+        for line in set(normalized_lines):
+            if line is None:
+                continue
+            verdicts[line] = (
+                indicated(line) is not None and
+                not rejected(line) and
+                self._classify_candidate(state.patterns, line, aggressive)
+                in self.CODE_DECISIONS)
+
+        return [verdicts[line] for line in normalized_lines]
+
+    def memo_info(self):
+        """Return hits, misses, maxsize and currsize of the decision memo."""
+        return self._state.memo.cache_info()
+
+    def _classify(self, patterns, line, aggressive):
+        """Return name of the decision for normalized comment text."""
         # Ignore non-comment related hashes. For example, "# Issue #999".
         if self.HASH_NUMBER.search(line):
-            return False
+            return 'hash-number'
 
         # Ignore whitelisted comments
-        if self.WHITELIST_REGEX.search(line):
-            return False
+        if patterns.whitelist.search(line):
+            return 'whitelist'
 
         if self.CODING_COMMENT_REGEX.match(line):
-            return False
+            return 'coding'
 
-        # Check that this is possibly code.
-        for symbol in self.CODE_INDICATORS:
-            if symbol in line:
-                break
-        else:
-            return False
+        return self._classify_candidate(patterns, line, aggressive)
 
-        if self.multiline_case(line, aggressive=aggressive):
-            return True
+    def _classify_candidate(self, patterns, line, aggressive):
+        """Return name of the decision for text that passed the whitelist."""
+        # Check that this is possibly code.
+        if not self.CODE_INDICATOR_REGEX.search(line):
+            return 'no-indicator'
 
-        for symbol in self.CODE_KEYWORDS_AGGR if aggressive else self.CODE_KEYWORDS:
-            if re.match(r'^\s*' + symbol + r'\s*:\s*$', line):
-                return True
+        structure = (patterns.structure_aggressive if aggressive else
+                     patterns.structure)
+        if structure is not None:
+            match = structure.match(line)
+            if match:
+                return match.lastgroup
+        elif self.multiline_case(line, aggressive=aggressive):
+            return 'multiline'
+        elif aggressive:
+            if patterns.code_keywords_aggressive.match(line):
+                return 'keyword'
+        elif patterns.code_keywords.match(line):
+            return 'keyword'
 
         line = self.PRINT_RETURN_REGEX.sub('', line)
 
         if self.PARTIAL_DICTIONARY_REGEX.match(line):
-            return True
+            return 'partial-dictionary'
+
+        if self.prose_case(line):
+            return 'prose'
 
         try:
-            compile(line, '<string>', 'exec')
+            with self.timer('compile'):
+                compile(line, '<string>', 'exec')
         except (SyntaxError, TypeError, UnicodeDecodeError):
-            return False
+            return 'syntax-error'
         else:
-            return True
+            return 'compile'
+
+    def timer(self, stage):
+        """Return context manager that times stage if stats are collected."""
+        if self.stats is None:
+            return contextlib.nullcontext()
+        return self.stats.timer(stage)
 
 
     def multiline_case(self, line, aggressive=True):
@@ -147,72 +333,546 @@ class Eradicator:
         return False
 
 
+    def prose_case(self, line):
+        """Return True if line is certainly not code, like most sentences.
+
+        Outside of strings and comments, two names can only be adjacent if
+        one of them is a keyword. This avoids compiling such lines.
+        """
+        for character in '\'"#\\':
+            if character in line:
+                return False
+
+        for match in self.ADJACENT_NAMES_REGEX.finditer(line):
+            if not any(keyword.iskeyword(name) or keyword.issoftkeyword(name)
+                       for name in match.groups()):
+                return True
+
+        return False
+
+
     def inline_script_metadata_ranges(self, source):
-        """Return a list of ranges of lines of inline script metadata."""
-        return [
-            range(
-                source.count('\n', 0, match.start()),
-                source.count('\n', 0, match.end()) + 1,
-            )
-            for match in self.INLINE_SCRIPT_METADATA.finditer(source)
-        ]
+        """Return a list of ranges of lines of inline script metadata.
+
+        source may also be memory-mapped bytes. Newlines are counted in a
+        single pass, continuing from the previous match.
+        """
+        if isinstance(source, str):
+            regex = self.INLINE_SCRIPT_METADATA
+            marker = '# ///'
+            count = functools.partial(source.count, '\n')
+        else:
+            regex = self.INLINE_SCRIPT_METADATA_BYTES
+            marker = b'# ///'
+            count = functools.partial(_count_newlines, source)
+
+        ranges = []
+        if source.find(marker) < 0:
+            return ranges
 
+        position = row = 0
+        for match in regex.finditer(source):
+            row += count(position, match.start())
+            position = match.start()
+            ranges.append(range(row, row + count(position, match.end()) + 1))
+        return ranges
 
-    def commented_out_code_line_numbers(self, source, aggressive=True):
+    def inline_script_metadata_rows(self, source):
+        """Return set of line numbers in inline_script_metadata_ranges()."""
+        return {row for rows in self.inline_script_metadata_ranges(source)
+                for row in rows}
+
+
+    def commented_out_code_line_numbers(self, source, aggressive=None):
         """Yield line numbers of commented-out code."""
-        inline_script_metadata_ranges = self.inline_script_metadata_ranges(source)
-        sio = io.StringIO(source)
+        # Tokenizing is expensive, so skip it if no comment could be code.
+        if not self.CODE_INDICATORS_REGEX.search(source):
+            return
+
+        yield from self._commented_out_code_line_numbers(
+            io.StringIO(source).readline,
+            self.inline_script_metadata_rows(source), aggressive)
+
+    def mapped_commented_out_code_line_numbers(self, data, encoding,
+                                               aggressive=None):
+        """Yield line numbers of commented-out code in memory-mapped data.
+
+        Lines are decoded one at a time, so no copy of the whole source is
+        made. encoding must be ASCII compatible, as Python source encodings
+        are.
+        """
+        if not self.CODE_INDICATORS_BYTES_REGEX.search(data):
+            return
+
+        yield from self._commented_out_code_line_numbers(
+            functools.partial(next, self.decode_lines(data, encoding), ''),
+            self.inline_script_metadata_rows(data), aggressive)
+
+    def _commented_out_code_line_numbers(self, readline,
+                                         inline_script_metadata_rows,
+                                         aggressive):
+        """Yield line numbers of commented-out code in lines of readline."""
         try:
-            for token in tokenize.generate_tokens(sio.readline):
+            for token in tokenize.generate_tokens(readline):
                 token_type = token[0]
                 start_row = token[2][0]
                 line = token[4]
 
                 if (token_type == tokenize.COMMENT and
                         line.lstrip().startswith('#') and
-                        not any(start_row in r for r in inline_script_metadata_ranges) and
+                        start_row not in inline_script_metadata_rows and
                         self.comment_contains_code(line, aggressive)):
                     yield start_row
         except (tokenize.TokenError, IndentationError):
             pass
 
 
-    def filter_commented_out_code(self, source, aggressive=True):
-        """Yield code with commented out code removed."""
-        marked_lines = list(self.commented_out_code_line_numbers(source,
-                                                            aggressive))
-        sio = io.StringIO(source)
-        previous_line = ''
-        for line_number, line in enumerate(sio.readlines(), start=1):
-            if (line_number not in marked_lines or
-                    previous_line.rstrip().endswith('\\')):
+    def scan(self, source, aggressive=None):
+        """Return Scan of source for commented-out code.
+
+        Unlike commented_out_code_line_numbers(), the result keeps what
+        rescan() needs to update it after an edit.
+        """
+        if aggressive is None:
+            aggressive = self.config.aggressive
+        lines = io.StringIO(source).readlines()
+        marked_lines, safe_rows, _, complete = self._scan_window(
+            lines, 0, aggressive)
+        return Scan(lines, aggressive, marked_lines, safe_rows, complete)
+
+    def rescan(self, previous, source, edit=None):
+        """Return Scan of source, which is an edited version of previous.
+
+        edit is a tuple (start, old_stop, new_stop) of 0-based line indices
+        telling that previous.lines[start:old_stop] were replaced by lines
+        [start:new_stop] of source. If it is None, it is computed by
+        comparing the lines.
+
+        Only the lines from the last safe row before the edit up to the
+        first row after the edit where tokenizing resynchronizes are
+        tokenized again. Otherwise the result is the same as scan(source).
+        """
+        lines = io.StringIO(source).readlines()
+        if not previous.complete:
+            return self.scan(source, previous.aggressive)
+
+        if edit is None:
+            edit = line_edit(previous.lines, lines)
+        start, old_stop, new_stop = edit
+        delta = new_stop - old_stop
+
+        # Resume tokenizing at an unchanged row with a fresh tokenizer state.
+        resume = max(previous.safe_rows.rfind(1, 0, start), 0)
+
+        def synchronized(row):
+            old_row = row - delta
+            return (row >= new_stop and
+                    old_row < len(previous.safe_rows) and
+                    previous.safe_rows[old_row])
+
+        window_marked_lines, window_safe_rows, stop, complete = (
+            self._scan_window(lines, resume, previous.aggressive,
+                              synchronized))
+
+        marked_lines = {row for row in previous.marked_lines
+                        if row <= resume}
+        marked_lines.update(window_marked_lines)
+        safe_rows = previous.safe_rows[:resume] + window_safe_rows
+        if not complete:
+            safe_rows += bytearray(len(lines) - len(safe_rows))
+        elif stop < len(lines):
+            marked_lines.update(row + delta for row in previous.marked_lines
+                                if row > stop - delta)
+            safe_rows += previous.safe_rows[stop - delta:]
+
+        return Scan(lines, previous.aggressive, frozenset(marked_lines),
+                    safe_rows, complete)
+
+    def _scan_window(self, lines, start, aggressive, synchronized=None):
+        """Tokenize lines from index start, which has a fresh state.
+
+        Stop before a safe row for which synchronized() is true. Return the
+        set of marked line numbers, a bytearray that is 1 for each safe row
+        from start up to the stop index, the stop index and whether
+        tokenizing went without errors.
+
+        A row is safe if tokenizing can restart there: it is not inside a
+        string, brackets or a continued line and starts with code at
+        column 0, so the indentation is fresh too.
+        """
+        def safe(row):
+            return lines[row][:1] not in ('', ' ', '\t', '\x0c', '#', '\\',
+                                          '\r', '\n')
+
+        safe_rows = bytearray([safe(start)]) if start < len(lines) else (
+            bytearray())
+        position = start
+
+        def readline():
+            nonlocal position
+            if position >= len(lines):
+                return ''
+            position += 1
+            return lines[position - 1]
+
+        candidates = []
+        stop = len(lines)
+        complete = True
+        depth = 0
+        try:
+            for token in tokenize.generate_tokens(readline):
+                token_type = token[0]
+                row = start + token[2][0] - 1
+                if token_type == tokenize.OP:
+                    if token[1] in '([{':
+                        depth += 1
+                    elif token[1] in ')]}':
+                        depth -= 1
+                elif token_type == tokenize.COMMENT:
+                    if token[4].lstrip().startswith('#'):
+                        candidates.append((row + 1, token[4]))
+                elif (token_type in (tokenize.NEWLINE, tokenize.NL) and
+                        depth == 0 and row + 1 < len(lines)):
+                    # The next row has a fresh state.
+                    safe_rows.extend(bytearray(row + 1 - start -
+                                               len(safe_rows)))
+                    if safe(row + 1):
+                        if synchronized is not None and synchronized(row + 1):
+                            stop = row + 1
+                            break
+                        safe_rows.append(1)
+                    else:
+                        safe_rows.append(0)
+        except (tokenize.TokenError, IndentationError):
+            complete = False
+        safe_rows.extend(bytearray(stop - start - len(safe_rows)))
+
+        metadata_rows = self.inline_script_metadata_rows(
+            ''.join(lines[start:stop]))
+        candidates = [(row, line) for row, line in candidates
+                      if row - start not in metadata_rows]
+        marked_lines = {
+            row for (row, _), verdict in zip(
+                candidates,
+                self.classify_comments([line for _, line in candidates],
+                                       aggressive))
+            if verdict}
+
+        return marked_lines, safe_rows, stop, complete
+
+    def filter_commented_out_code(self, source, aggressive=None,
+                                  marked_lines=None):
+        """Yield code with commented out code removed.
+
+        marked_lines may be given to reuse line numbers that were already
+        computed by commented_out_code_line_numbers(). Then source may also
+        be an iterable of lines.
+        """
+        if marked_lines is None:
+            marked_lines = self.commented_out_code_line_numbers(source,
+                                                                aggressive)
+        for line, removed in self._removals(source, marked_lines):
+            if not removed:
                 yield line
+
+    def _removals(self, source, marked_lines):
+        """Yield each line of source and whether it is removed.
+
+        source may also be an iterable of lines.
+        """
+        marked_lines = set(marked_lines)
+        sio = io.StringIO(source) if isinstance(source, str) else source
+        previous_line = ''
+        for line_number, line in enumerate(sio, start=1):
+            yield line, (line_number in marked_lines and
+                         not previous_line.rstrip().endswith('\\'))
             previous_line = line
 
 
-    def fix_file(self, filename, args, standard_out):
+    def cached_commented_out_code_line_numbers(self, source, aggressive=None):
+        """Return line numbers of commented-out code, using the cache."""
+        if self.cache is None:
+            with self.timer('find'):
+                return list(self.commented_out_code_line_numbers(source,
+                                                                 aggressive))
+
+        config = self.config
+        if aggressive is None:
+            aggressive = config.aggressive
+        key = self.cache.key(source, aggressive,
+                             repr(config._replace(aggressive=None)))
+        marked_lines = self.cache.get(key)
+        if marked_lines is None:
+            with self.timer('find'):
+                marked_lines = list(self.commented_out_code_line_numbers(
+                    source, aggressive))
+            self.cache.set(key, marked_lines)
+        elif self.stats is not None:
+            self.stats.count('cache-hit')
+        return marked_lines
+
+
+    def fix_file(self, filename, args, standard_out, lines=None):
+        """Run filter_commented_out_code() on file.
+
+        If lines is given, only commented-out code on these line numbers is
+        removed.
+        """
+        if self.stats is None:
+            return self._fix_file(filename, args, standard_out, lines)
+
+        start = time.perf_counter()
+        try:
+            return self._fix_file(filename, args, standard_out, lines)
+        finally:
+            self.stats.add_file(filename, time.perf_counter() - start)
+
+    def _fix_file(self, filename, args, standard_out, lines=None):
         """Run filter_commented_out_code() on file."""
-        encoding = self.detect_encoding(filename)
-        with self.open_with_encoding(filename, encoding=encoding) as input_file:
-            source = input_file.read()
-
-        filtered_source = ''.join(self.filter_commented_out_code(source,
-                                                            args.aggressive))
-
-        if source != filtered_source:
-            if args.in_place:
-                with self.open_with_encoding(filename, mode='w',
-                                        encoding=encoding) as output_file:
-                    output_file.write(filtered_source)
-            else:
-                diff = difflib.unified_diff(
-                    source.splitlines(),
-                    filtered_source.splitlines(),
-                    'before/' + filename,
-                    'after/' + filename,
-                    lineterm='')
-                standard_out.write('\n'.join(list(diff) + ['']))
-            return True
+        if os.path.getsize(filename) >= self.LARGE_FILE_SIZE:
+            return self._fix_large_file(filename, args, standard_out, lines)
+
+        with self.timer('read'):
+            source, encoding = self.read_with_encoding(filename)
+
+        marked_lines = self.cached_commented_out_code_line_numbers(
+            source, args.aggressive)
+        if lines is not None:
+            marked_lines = [number for number in marked_lines
+                            if number in lines]
+
+        if not args.in_place:
+            if self.write_result(source, marked_lines, filename,
+                                 args.aggressive, standard_out):
+                return True
+            return None
+
+        # Leave files without changes untouched.
+        if not any(removed
+                   for _, removed in self._removals(source, marked_lines)):
+            return None
+
+        with self.timer('write'), \
+                self.open_atomically(filename, encoding) as output_file:
+            output_file.writelines(self.filter_commented_out_code(
+                source, args.aggressive, marked_lines=marked_lines))
+        return True
+
+    def _fix_large_file(self, filename, args, standard_out, lines=None):
+        """Run filter_commented_out_code() on memory-mapped file.
+
+        Memory use does not grow with the size of the file, as the file is
+        never decoded as a whole.
+        """
+        with self.open_mapped(filename) as data:
+            encoding = self.mapped_encoding(data)
+            with self.timer('find'):
+                marked_lines = list(
+                    self.mapped_commented_out_code_line_numbers(
+                        data, encoding, args.aggressive))
+            if lines is not None:
+                marked_lines = [number for number in marked_lines
+                                if number in lines]
+            if not marked_lines:
+                return None
+
+            if not args.in_place:
+                if self.write_result(self.decode_lines(data, encoding),
+                                     marked_lines, filename, args.aggressive,
+                                     standard_out):
+                    return True
+                return None
+
+            if not any(removed for _, removed in self._removals(
+                    self.decode_lines(data, encoding), marked_lines)):
+                return None
+
+        # The mapping is closed before the file is replaced.
+        with self.timer('write'), \
+                self.open_atomically(filename, encoding) as output_file, \
+                self.open_mapped(filename) as data:
+            output_file.writelines(self.filter_commented_out_code(
+                self.decode_lines(data, encoding), args.aggressive,
+                marked_lines=marked_lines))
+        return True
+
+
+    def fix_standard_input(self, standard_input, args, standard_out):
+        """Run filter_commented_out_code() on standard input.
+
+        With args.in_place, the filtered source is written to standard_out
+        line by line. Otherwise a diff or the findings are written.
+
+        If standard input has a binary buffer, it is decoded like a file,
+        honouring coding cookies, and the filtered source is written to the
+        buffer of standard_out in the same encoding.
+        """
+        if hasattr(standard_input, 'buffer'):
+            source, encoding = self.decode(standard_input.buffer.read())
+        else:
+            source, encoding = standard_input.read(), None
+
+        marked_lines = self.cached_commented_out_code_line_numbers(
+            source, args.aggressive)
+
+        if args.in_place:
+            output = standard_out
+            if encoding is not None and hasattr(standard_out, 'buffer'):
+                standard_out.flush()
+                output = codecs.getwriter(encoding)(standard_out.buffer)
+
+            length = 0
+            for line in self.filter_commented_out_code(
+                    source, args.aggressive, marked_lines=marked_lines):
+                output.write(line)
+                length += len(line)
+            output.flush()
+            # Only whole lines, all of them non-empty, are ever removed.
+            return length != len(source)
+
+        return self.write_result(source, marked_lines, 'stdin',
+                                 args.aggressive, standard_out)
+
+
+    async def acheck_paths(self, paths, aggressive=None, concurrency=8,
+                           executor=None):
+        """Yield CheckResult of each file as soon as it is checked.
+
+        Up to concurrency files are checked at a time. Files are read in
+        threads, while finding commented-out code runs in executor, which
+        may also be a process pool. The default executor of the event loop
+        is used if it is None.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+
+        async def check(filename):
+            try:
+                source = (await asyncio.to_thread(self.read_with_encoding,
+                                                  filename))[0]
+            except OSError as exception:
+                return CheckResult(filename, [], f'{exception}')
+            marked_lines = await loop.run_in_executor(
+                executor, self.cached_commented_out_code_line_numbers,
+                source, aggressive)
+            return CheckResult(filename, marked_lines, None)
+
+        paths = iter(paths)
+        pending = set()
+        try:
+            while True:
+                for filename in paths:
+                    pending.add(asyncio.ensure_future(check(filename)))
+                    if len(pending) >= concurrency:
+                        break
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def write_result(self, source, marked_lines, filename, aggressive,
+                     standard_out):
+        """Write diff, or findings if there is a report.
+
+        Return True if anything is removed.
+        """
+        if self.report is None:
+            return self.write_diff(source, marked_lines, filename,
+                                   standard_out)
+
+        found = False
+        for finding in self.findings(source, marked_lines, filename,
+                                     aggressive):
+            self.report.add(finding)
+            found = True
+        return found
+
+    def findings(self, source, marked_lines, filename, aggressive=None):
+        """Yield Finding of each line that is removed from source.
+
+        source may also be an iterable of lines.
+        """
+        for number, (line, removed) in enumerate(
+                self._removals(source, marked_lines), start=1):
+            if removed:
+                # Already counted in the statistics when it was marked.
+                yield Finding(filename, number, line.rstrip('\r\n'),
+                              self._decide(line, aggressive))
+
+    def write_diff(self, source, marked_lines, filename, standard_out):
+        """Write unified diff of removing marked lines from source.
+
+        Return True if anything is removed.
+        """
+        changed = False
+        with self.timer('diff'):
+            for line in self.unified_diff(source, marked_lines, filename):
+                standard_out.write(line)
+                changed = True
+        return changed
+
+    def unified_diff(self, source, marked_lines, filename, context=3):
+        """Yield lines of unified diff of removing marked lines from source.
+
+        The output is that of difflib.unified_diff() on the lines of source
+        and of the filtered source. Since lines are only ever removed, the
+        hunks follow from the marked lines without matching sequences, and
+        only one hunk is held in memory at a time.
+        """
+        header = ['--- before/' + filename + '\n',
+                  '+++ after/' + filename + '\n']
+        before = collections.deque(maxlen=context)
+        after = []
+        hunk = None
+        old_row = new_row = 0
+        old_start = new_start = 0
+
+        for physical_line, removed in self._removals(source, marked_lines):
+            # Split like source.splitlines() does.
+            for line in physical_line.splitlines():
+                if removed:
+                    if hunk is None:
+                        hunk = [' ' + text for text in before]
+                        old_start = old_row - len(before)
+                        new_start = new_row - len(before)
+                    else:
+                        hunk += [' ' + text for text in after]
+                    after = []
+                    hunk.append('-' + line)
+                    old_row += 1
+                    continue
+
+                old_row += 1
+                new_row += 1
+                if hunk is None:
+                    before.append(line)
+                    continue
+
+                after.append(line)
+                # Too many unchanged lines to join the next change.
+                if len(after) > 2 * context:
+                    yield from header
+                    header = []
+                    yield from _format_hunk(
+                        hunk + [' ' + text for text in after[:context]],
+                        old_start, old_row - len(after) + context,
+                        new_start, new_row - len(after) + context)
+                    before.extend(after)
+                    after = []
+                    hunk = None
+
+        if hunk is not None:
+            trailing = after[:context]
+            yield from header
+            yield from _format_hunk(
+                hunk + [' ' + text for text in trailing],
+                old_start, old_row - len(after) + len(trailing),
+                new_start, new_row - len(after) + len(trailing))
 
 
     def open_with_encoding(self, filename, encoding, mode='r'):
@@ -221,45 +881,1011 @@ class Eradicator:
                        newline='')  # Preserve line endings
 
 
-    def detect_encoding(self, filename):
-        """Return file encoding."""
+    @contextlib.contextmanager
+    def open_atomically(self, filename, encoding):
+        """Return opened file that replaces filename, keeping permissions.
+
+        The file is a temporary file in the same directory, which replaces
+        filename once it is closed without errors. So filename is either
+        left as it was or completely written, even if writing fails halfway.
+        """
+        import tempfile
+        # Replace the target of a symbolic link, not the link.
+        filename = os.path.realpath(filename)
+        mode = stat.S_IMODE(os.stat(filename).st_mode)
+        descriptor, temporary = tempfile.mkstemp(
+            dir=os.path.dirname(filename),
+            prefix='.' + os.path.basename(filename) + '.', suffix='.tmp')
         try:
-            with open(filename, 'rb') as input_file:
-                encoding = tokenize.detect_encoding(input_file.readline)[0]
+            with os.fdopen(descriptor, 'w', encoding=encoding,
+                           newline='') as output_file:  # Preserve line endings
+                yield output_file
+            os.chmod(temporary, mode)
+            os.replace(temporary, filename)
+        except BaseException:
+            os.remove(temporary)
+            raise
 
-                # Check for correctness of encoding.
-                with self.open_with_encoding(filename, encoding) as input_file:
-                    input_file.read()
+    @contextlib.contextmanager
+    def open_mapped(self, filename):
+        """Return read-only memory map of file."""
+        import mmap
+        with open(filename, 'rb') as input_file, \
+                mmap.mmap(input_file.fileno(), 0,
+                          access=mmap.ACCESS_READ) as data:
+            yield data
 
-            return encoding
+    def mapped_encoding(self, data, chunk_size=1024 * 1024):
+        """Return encoding of memory-mapped Python source.
+
+        As in decode(), latin-1 is used if the data cannot be decoded with
+        the declared encoding. The data is decoded chunk by chunk to find
+        out.
+        """
+        data.seek(0)
+        try:
+            encoding = tokenize.detect_encoding(data.readline)[0]
+            decoder = codecs.getincrementaldecoder(encoding)()
+            for start in range(0, len(data), chunk_size):
+                decoder.decode(data[start:start + chunk_size])
+            decoder.decode(b'', final=True)
         except (SyntaxError, LookupError, UnicodeDecodeError):
             return 'latin-1'
+        return encoding
+
+    def decode_lines(self, data, encoding):
+        """Yield lines of memory-mapped data, decoding one at a time."""
+        decoder = codecs.getincrementaldecoder(encoding)()
+        start = 0
+        while start < len(data):
+            stop = data.find(b'\n', start) + 1 or len(data)
+            yield decoder.decode(data[start:stop])
+            start = stop
+        line = decoder.decode(b'', final=True)
+        if line:
+            yield line
+
+    def detect_encoding(self, filename):
+        """Return file encoding."""
+        return self.read_with_encoding(filename)[1]
+
+    def read_with_encoding(self, filename):
+        """Return source and encoding of file, reading it only once."""
+        with open(filename, 'rb') as input_file:
+            data = input_file.read()
+        return self.decode(data)
+
+    def decode(self, data):
+        """Return data decoded as Python source and the encoding used.
+
+        Line endings are preserved.
+        """
+        try:
+            encoding = tokenize.detect_encoding(io.BytesIO(data).readline)[0]
+            return data.decode(encoding), encoding
+        except (SyntaxError, LookupError, UnicodeDecodeError):
+            return data.decode('latin-1'), 'latin-1'
 
     def update_whitelist(self, new_whitelist, extend_default=True):
         """Updates the whitelist."""
         if extend_default:
-            self.WHITELIST_REGEX = re.compile(
-                r'|'.join(list(self.DEFAULT_WHITELIST) + new_whitelist),
-                flags=re.IGNORECASE)
+            whitelist = tuple(self.DEFAULT_WHITELIST) + tuple(new_whitelist)
         else:
-            self.WHITELIST_REGEX = re.compile(
-                r'|'.join(new_whitelist),
-                flags=re.IGNORECASE)
+            whitelist = tuple(new_whitelist)
+        self.configure(self.config._replace(whitelist=whitelist))
 
 
-def main(argv=sys.argv, standard_out=sys.stdout, standard_error=sys.stderr):
-    """Main entry point."""
+def _format_hunk(lines, old_start, old_stop, new_start, new_stop):
+    """Yield header and lines of a hunk of a unified diff."""
+    old_range = _format_range(old_start, old_stop)
+    new_range = _format_range(new_start, new_stop)
+    yield f'@@ -{old_range} +{new_range} @@\n'
+    for line in lines:
+        yield line + '\n'
+
+
+def _format_range(start, stop):
+    """Return range of a hunk header like difflib.unified_diff() does."""
+    length = stop - start
+    if length == 1:
+        return f'{start + 1}'
+    if not length:
+        return f'{start},0'
+    return f'{start + 1},{length}'
+
+
+class Config(collections.namedtuple(
+        'Config', ['whitelist', 'aggressive', 'code_keywords',
+                   'code_keywords_aggressive'],
+        defaults=[Eradicator.DEFAULT_WHITELIST, True,
+                  tuple(Eradicator.CODE_KEYWORDS),
+                  tuple(Eradicator.CODE_KEYWORDS_AGGR)])):
+    """Immutable configuration of an Eradicator.
+
+    whitelist is a tuple of regexes matched case insensitively against
+    comments that are never code. aggressive is used where the aggressive
+    argument of a method is None. code_keywords is a tuple of regexes of
+    statements that are code if followed by a colon, and
+    code_keywords_aggressive is used instead in aggressive mode. Other
+    sequences of regexes, like lists, are converted to tuples, so that a
+    Config can be hashed.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, *args, **kwargs):
+        config = super().__new__(cls, *args, **kwargs)
+        return super().__new__(cls, tuple(config.whitelist),
+                               config.aggressive,
+                               tuple(config.code_keywords),
+                               tuple(config.code_keywords_aggressive))
+
+    @classmethod
+    def _make(cls, iterable):
+        # Let _replace() convert sequences as well.
+        return cls(*iterable)
+
+
+class Patterns(collections.namedtuple('Patterns', [
+        'whitelist', 'rejection', 'code_keywords',
+        'code_keywords_aggressive', 'structure', 'structure_aggressive'])):
+    """Regexes compiled from a Config by compile_config().
+
+    structure and structure_aggressive are the structure_regex() of either
+    mode, or None if the code keywords cannot be combined into one regex.
+    """
+
+    __slots__ = ()
+
+
+_State = collections.namedtuple('_State', ['config', 'patterns', 'memo'])
+
+
+@functools.lru_cache(maxsize=128)
+def compile_config(config):
+    """Return Patterns of config, compiled once per distinct Config."""
+    whitelist = re.compile(r'|'.join(config.whitelist), flags=re.IGNORECASE)
+    code_keywords = re.compile(
+        r'^\s*(?:' + r'|'.join(config.code_keywords) + r')\s*:\s*$')
+    code_keywords_aggressive = re.compile(
+        r'^\s*(?:' + r'|'.join(config.code_keywords_aggressive) +
+        r')\s*:\s*$')
+
+    # Code keywords may use the group names of structure_regex(), or global
+    # flags that are only deprecated if misplaced before Python 3.11.
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            structure = (
+                structure_regex(code_keywords.pattern, aggressive=False),
+                structure_regex(code_keywords_aggressive.pattern,
+                                aggressive=True))
+    except (re.error, DeprecationWarning):
+        structure = (None, None)
+
+    return Patterns(whitelist, rejection_regex(whitelist.pattern),
+                    code_keywords, code_keywords_aggressive, *structure)
+
+
+def structure_regex(code_keywords_pattern, aggressive):
+    """Return regex doing the checks of multiline_case() and code keywords.
+
+    The name of the group that matches is the decision, multiline or
+    keyword. Multiline takes precedence, as in Eradicator.multiline_case().
+    """
+    multiline = [
+        # Ends with a backslash.
+        r'(?s:.*)\\\Z',
+        Eradicator.MULTILINE_ASSIGNMENT_REGEX.pattern,
+        Eradicator.BRACKET_REGEX.pattern,
+    ]
+    if aggressive:
+        multiline += [
+            r'(?s:.*)[)\]}]:\Z',
+            r'\s*[)\]}],\s*\Z',
+            # One scan for the statements that are searched anywhere.
+            r'(?s:.*?)(?:' + r'|'.join(
+                regex.pattern
+                for regex in (Eradicator.DEF_STATEMENT_REGEX,
+                              Eradicator.WITH_STATEMENT_REGEX,
+                              Eradicator.FOR_STATEMENT_REGEX)) + r')',
+        ]
+
+    return re.compile(
+        r'(?:' + r'|'.join(r'(?=' + pattern + r')' for pattern in multiline) +
+        r')(?P<multiline>)|(?=' + code_keywords_pattern + r')(?P<keyword>)')
+
+
+class Scan(collections.namedtuple('Scan', [
+        'lines', 'aggressive', 'marked_lines', 'safe_rows', 'complete'])):
+    """Result of Eradicator.scan() and Eradicator.rescan().
+
+    marked_lines is the set of line numbers of commented-out code, the same
+    as from Eradicator.commented_out_code_line_numbers(). safe_rows and
+    complete are bookkeeping for Eradicator.rescan().
+    """
+
+    __slots__ = ()
+
+
+class CheckResult(collections.namedtuple('CheckResult', [
+        'filename', 'marked_lines', 'error'])):
+    """Result of Eradicator.acheck_paths() for a file.
+
+    marked_lines is the list of line numbers of commented-out code. error is
+    the message of the OSError that kept the file from being checked, if
+    any.
+    """
+
+    __slots__ = ()
+
+
+class Finding(collections.namedtuple('Finding', [
+        'filename', 'line', 'text', 'decision'])):
+    """Line of commented-out code.
+
+    decision is the name of the decision of Eradicator.classify_comment().
+    """
+
+    __slots__ = ()
+
+
+class Report:
+    """Write findings one at a time in one of FORMATS.
+
+    "lines" writes "filename:line: [decision] text" lines, "json" one JSON
+    object per line and "sarif" a SARIF 2.1.0 log. start() and finish()
+    write what comes before and after the findings.
+    """
+
+    FORMATS = ('lines', 'json', 'sarif')
+
+    def __init__(self, output_format, output):
+        self.output_format = output_format
+        self.output = output
+        self.count = 0
+
+    def start(self):
+        """Write what comes before the findings."""
+        if self.output_format == 'sarif':
+            self.output.write(self._sarif_log().rsplit('[]', 1)[0] + '[\n')
+
+    def add(self, finding):
+        """Write finding."""
+        if self.output_format == 'lines':
+            self.output.write(f'{finding.filename}:{finding.line}: '
+                              f'[{finding.decision}] {finding.text}\n')
+        elif self.output_format == 'json':
+            self.output.write(json.dumps(finding._asdict()) + '\n')
+        else:
+            self.output.write((',\n' if self.count else '') +
+                              json.dumps(self._sarif_result(finding)))
+        self.count += 1
+
+    def finish(self):
+        """Write what comes after the findings."""
+        if self.output_format == 'sarif':
+            self.output.write(('\n' if self.count else '') + ']' +
+                              self._sarif_log().rsplit('[]', 1)[1] + '\n')
+
+    def _sarif_log(self):
+        """Return SARIF log whose results come last and are empty."""
+        return json.dumps({
+            '$schema': 'https://json.schemastore.org/sarif-2.1.0.json',
+            'version': '2.1.0',
+            'runs': [{
+                'tool': {'driver': {
+                    'name': 'eradicate',
+                    'version': __version__,
+                    'informationUri': 'https://github.com/PyCQA/eradicate',
+                    'rules': [{
+                        'id': 'commented-out-code',
+                        'shortDescription': {
+                            'text': 'Commented-out code'}}]}},
+                'results': []}]})
+
+    def _sarif_result(self, finding):
+        """Return SARIF result of finding."""
+        return {
+            'ruleId': 'commented-out-code',
+            'level': 'warning',
+            'message': {'text': 'Found commented-out code'},
+            'locations': [{'physicalLocation': {
+                'artifactLocation': {
+                    'uri': finding.filename.replace(os.sep, '/')},
+                'region': {'startLine': finding.line,
+                           'snippet': {'text': finding.text}}}}],
+            'properties': {'decision': finding.decision}}
+
+
+def _count_newlines(data, start, stop, chunk_size=1 << 20):
+    """Return number of newlines in data[start:stop], a chunk at a time."""
+    count = 0
+    for position in range(start, stop, chunk_size):
+        count += data[position:min(position + chunk_size, stop)].count(b'\n')
+    return count
+
+
+def line_edit(old_lines, new_lines):
+    """Return (start, old_stop, new_stop) of the lines that differ."""
+    start = 0
+    limit = min(len(old_lines), len(new_lines))
+    while start < limit and old_lines[start] == new_lines[start]:
+        start += 1
+
+    old_stop = len(old_lines)
+    new_stop = len(new_lines)
+    while (old_stop > start and new_stop > start and
+           old_lines[old_stop - 1] == new_lines[new_stop - 1]):
+        old_stop -= 1
+        new_stop -= 1
+
+    return start, old_stop, new_stop
+
+
+class Statistics:
+    """Statistics about where the time of a run goes.
+
+    Collects wall time per stage, counts of comments per decision of
+    Eradicator.classify_comment(), cache hits and the slowest files. Set an
+    instance as the stats attribute of an Eradicator to collect them.
+    """
+
+    # Stages whose time includes the time of the stage nested in them.
+    NESTED_STAGES = {'find': 'classify', 'classify': 'compile'}
+
+    def __init__(self, slowest=10):
+        self.times = collections.Counter()
+        self.counts = collections.Counter()
+        self.files = 0
+        self.slowest = []
+        self.slowest_limit = slowest
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Add wall time of the with block to stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[stage] += time.perf_counter() - start
+
+    def count(self, name):
+        """Count an event such as a decision or a cache hit."""
+        self.counts[name] += 1
+
+    def add_file(self, filename, seconds):
+        """Record the time spent on a file."""
+        self.files += 1
+        self._add_slowest((seconds, filename))
+
+    def _add_slowest(self, entry):
+        """Keep (seconds, filename) entry if it is among the slowest."""
+        if len(self.slowest) < self.slowest_limit:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    def update(self, other):
+        """Add statistics collected elsewhere, for example in a worker."""
+        self.times.update(other.times)
+        self.counts.update(other.counts)
+        self.files += other.files
+        for entry in other.slowest:
+            self._add_slowest(entry)
+
+    def exclusive_times(self):
+        """Return wall time per stage excluding nested stages.
+
+        "find" becomes "tokenize", being what remains of it after
+        classifying comments.
+        """
+        times = dict(self.times)
+        for stage, nested in self.NESTED_STAGES.items():
+            if stage in times:
+                times[stage] -= times.get(nested, 0.0)
+        if 'find' in times:
+            times['tokenize'] = times.pop('find')
+        return times
+
+    def as_dict(self):
+        """Return statistics as a JSON-serializable dictionary."""
+        return {
+            'files': self.files,
+            'times': self.exclusive_times(),
+            'counts': dict(self.counts),
+            'slowest': [{'filename': filename, 'seconds': seconds}
+                        for seconds, filename in sorted(self.slowest,
+                                                        reverse=True)],
+        }
+
+    def format(self):
+        """Return statistics as text."""
+        lines = [f'files: {self.files}', 'time per stage:']
+        for stage, seconds in sorted(self.exclusive_times().items(),
+                                     key=lambda item: -item[1]):
+            lines.append(f'  {stage:<20} {seconds:10.4f}s')
+        lines.append('counts:')
+        for name, number in sorted(self.counts.items()):
+            lines.append(f'  {name:<20} {number:10d}')
+        lines.append('slowest files:')
+        for seconds, filename in sorted(self.slowest, reverse=True):
+            lines.append(f'  {seconds:10.4f}s {filename}')
+        return '\n'.join(lines)
+
+
+class ResultCache:
+    """On-disk cache of commented-out code line numbers.
+
+    Each entry is a small JSON file named after a hash of the source and of
+    everything that influences the result. Entries are written atomically,
+    so several processes may share a cache directory.
+    """
+
+    # maybe_prune() lets the cache grow this much beyond max_entries, so
+    # that it does not prune on every run once the cache is full.
+    PRUNE_SLACK = 1.1
+
+    def __init__(self, directory, max_entries=50000):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def key(self, source, aggressive, options):
+        """Return cache key of source checked with the given options.
+
+        options is a string that identifies the rest of the configuration.
+        Results rely on compile(), so the interpreter is part of the key.
+        """
+        import hashlib
+        digest = hashlib.sha256()
+        for part in (__version__, str(sys.implementation.cache_tag),
+                     str(aggressive), options):
+            digest.update(part.encode('utf-8', 'surrogatepass') + b'\0')
+        digest.update(source.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        """Return path of the entry file for key."""
+        return os.path.join(self.directory, key[:2], key[2:] + '.json')
+
+    def get(self, key):
+        """Return cached line numbers or None."""
+        path = self.path(key)
+        try:
+            with open(path, encoding='utf-8') as input_file:
+                marked_lines = json.load(input_file)
+            # Mark the entry as recently used.
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return marked_lines
+
+    def set(self, key, marked_lines):
+        """Store line numbers in the cache."""
+        import tempfile
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(
+                dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(descriptor, 'w', encoding='utf-8') as output:
+                    json.dump(marked_lines, output)
+                os.replace(temporary, path)
+            except BaseException:
+                os.remove(temporary)
+                raise
+        except OSError:
+            # Caching is best effort.
+            pass
+
+    def maybe_prune(self):
+        """Run prune() if a sample suggests there are too many entries.
+
+        The number of entries is estimated from one subdirectory picked at
+        random, so that most runs do not walk the whole cache.
+        """
+        try:
+            with os.scandir(self.directory) as entries:
+                subdirectories = [entry.path for entry in entries
+                                  if entry.is_dir()]
+            if not subdirectories:
+                return
+            with os.scandir(random.choice(subdirectories)) as entries:
+                sample = sum(1 for entry in entries
+                             if entry.name.endswith('.json'))
+        except OSError:
+            return
+
+        if sample * len(subdirectories) > self.max_entries * self.PRUNE_SLACK:
+            self.prune()
+
+    def prune(self):
+        """Remove least recently used entries beyond max_entries."""
+        entries = []
+        for root, _, children in os.walk(self.directory):
+            for child in children:
+                if not child.endswith('.json'):
+                    continue
+                path = os.path.join(root, child)
+                try:
+                    entries.append((os.stat(path).st_mtime_ns, path))
+                except OSError:
+                    pass
+
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                # Another process may have removed it already.
+                pass
+
+
+class SkipIndex:
+    """Index of files that earlier runs found clean.
+
+    The index file maps the absolute path of each checked file to its
+    mtime_ns, size and inode and to the verdict: clean, racy or code. A file
+    whose stat is unchanged since it was found clean is skipped without
+    being read. Files modified less than RACY_NS before they were checked
+    are racy: a change within the granularity of their timestamp could go
+    unnoticed, so they are checked again by content in the next run.
+
+    options identifies the version, the interpreter and the configuration;
+    an index written with other options is discarded. Entries are kept in
+    the order they were last used, and only the max_entries most recent
+    ones are written. The index is only written if entries changed, and
+    atomically, so concurrent runs lose entries at worst.
+    """
+
+    RACY_NS = 2 * 10**9
+
+    def __init__(self, path, options, max_entries=100000):
+        self.path = path
+        self.options = options
+        self.max_entries = max_entries
+        self.entries = {}
+        self.status = {}
+        self.hits = 0
+        self.dirty = False
+
+    def load(self):
+        """Read the entries of the index file, if it is usable."""
+        try:
+            with open(self.path, encoding='utf-8') as input_file:
+                index = json.load(input_file)
+            if index['options'] == self.options:
+                self.entries = index['files']
+        except (OSError, ValueError, KeyError, TypeError):
+            self.entries = {}
+
+    def changed(self, filename):
+        """Return False if filename is unchanged since it was found clean.
+
+        The status of filename is kept for record().
+        """
+        key = os.path.abspath(filename)
+        checked = time.time_ns()
+        try:
+            status = os.stat(filename)
+        except OSError:
+            # Checking reports the error.
+            if self.entries.pop(key, None) is not None:
+                self.dirty = True
+            return True
+
+        entry = self.entries.pop(key, None)
+        self.status[filename] = (status, checked, entry)
+        if entry == [status.st_mtime_ns, status.st_size, status.st_ino,
+                     'clean']:
+            self.entries[key] = entry
+            self.hits += 1
+            return False
+        return True
+
+    def record(self, filename, clean):
+        """Record verdict of filename, checked after calling changed()."""
+        if filename not in self.status:
+            return
+        status, checked, entry = self.status.pop(filename)
+        if not clean:
+            verdict = 'code'
+        elif status.st_mtime_ns >= checked - self.RACY_NS:
+            verdict = 'racy'
+        else:
+            verdict = 'clean'
+        new_entry = [status.st_mtime_ns, status.st_size, status.st_ino,
+                     verdict]
+        self.entries[os.path.abspath(filename)] = new_entry
+        if new_entry != entry:
+            self.dirty = True
+
+    def save(self):
+        """Write the index file if entries changed."""
+        import tempfile
+        if not self.dirty:
+            return
+        try:
+            descriptor, temporary = tempfile.mkstemp(
+                dir=os.path.dirname(self.path), suffix='.tmp')
+            try:
+                with os.fdopen(descriptor, 'w', encoding='utf-8') as output:
+                    json.dump({'options': self.options,
+                               'files': dict(list(self.entries.items())[
+                                   -self.max_entries:])}, output)
+                os.replace(temporary, self.path)
+            except BaseException:
+                os.remove(temporary)
+                raise
+        except OSError:
+            # The index is best effort.
+            pass
+
+
+DEFAULT_EXCLUDE = ('__pycache__', '__pypackages__', '_build', 'buck-out',
+                   'build', 'dist', 'node_modules', 'venv', '*.egg')
+
+
+def find_files(filenames, recursive, exclude=DEFAULT_EXCLUDE):
+    """Yield filenames, drilling down directories if recursive.
+
+    While drilling down, hidden files and directories, those matching one
+    of the exclude globs and those ignored by .gitignore files are skipped.
+    """
+    for name in filenames:
+        if recursive and os.path.isdir(name):
+            yield from walk_directory(name, exclude)
+        else:
+            yield name
+
+
+def walk_directory(top, exclude=DEFAULT_EXCLUDE):
+    """Yield Python files below directory top, sorted by path.
+
+    Directories are walked depth-first, with directory names sorted as if
+    followed by a separator, so paths come out in sorted order. Excluded
+    directories are pruned without listing them. Symbolic links to
+    directories are not followed. The .gitignore files above top apply as
+    well, up to the top level of its git work tree.
+    """
+    def children(directory, rules):
+        rules += gitignore_rules(directory)
+        try:
+            with os.scandir(directory) as scanner:
+                entries = list(scanner)
+        except OSError:
+            return
+
+        kept = []
+        for entry in entries:
+            if entry.name.startswith('.') or any(
+                    fnmatch.fnmatch(entry.name, pattern) or
+                    fnmatch.fnmatch(entry.path, pattern)
+                    for pattern in exclude):
+                continue
+
+            try:
+                is_directory = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if gitignored(entry.path, entry.name, is_directory, rules):
+                continue
+
+            if is_directory:
+                kept.append((entry.name + os.sep, entry.path))
+            elif entry.name.endswith('.py'):
+                kept.append((entry.name, entry.path))
+
+        for key, path in sorted(kept):
+            yield path, key.endswith(os.sep), rules
+
+    stack = [children(top, ancestor_gitignore_rules(top))]
+    while stack:
+        for path, is_directory, rules in stack[-1]:
+            if is_directory:
+                stack.append(children(path, rules))
+                break
+            yield path
+        else:
+            stack.pop()
+
+
+def gitignore_rules(directory, filename=None, prefix=''):
+    """Return rules of the .gitignore file in directory.
+
+    Only a subset of the syntax is supported: "**" is treated like "*".
+    As in git, the last matching rule wins, so a negated pattern re-includes
+    what earlier rules exclude.
+
+    filename may be another file with rules for directory, such as that of
+    a directory above it. Patterns with a slash then match paths below
+    directory prefixed with prefix, the path of directory relative to that
+    of filename.
+    """
+    if filename is None:
+        filename = os.path.join(directory, '.gitignore')
+    try:
+        with open(filename, encoding='utf-8',
+                  errors='replace') as input_file:
+            lines = input_file.read().splitlines()
+    except OSError:
+        return ()
+
+    rules = []
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        elif line.startswith(('\\#', '\\!')):
+            line = line[1:]
+        directory_only = line.endswith('/')
+        line = line.rstrip('/')
+        if line.startswith('**/'):
+            line = line[3:]
+        # Patterns with a slash are relative to the .gitignore file.
+        anchored = '/' in line
+        rules.append((directory, prefix, line.lstrip('/').replace('**', '*'),
+                      anchored, directory_only, negated))
+    return tuple(rules)
+
+
+def ancestor_gitignore_rules(top):
+    """Return rules that apply to directory top from the directories above.
+
+    These are the rules of .git/info/exclude and of the .gitignore files
+    from the top level of the git work tree down to the parent of top.
+    Outside of a git work tree there are none.
+    """
+    absolute = os.path.abspath(top)
+    directories = [absolute]
+    while not os.path.exists(os.path.join(directories[-1], '.git')):
+        parent = os.path.dirname(directories[-1])
+        if parent == directories[-1]:
+            return ()
+        directories.append(parent)
+
+    def prefix(directory):
+        path = os.path.relpath(absolute, directory)
+        return '' if path == os.curdir else path.replace(os.sep, '/') + '/'
+
+    rules = gitignore_rules(
+        top, os.path.join(directories[-1], '.git', 'info', 'exclude'),
+        prefix(directories[-1]))
+    for directory in reversed(directories[1:]):
+        rules += gitignore_rules(top, os.path.join(directory, '.gitignore'),
+                                 prefix(directory))
+    return rules
+
+
+def gitignored(path, name, is_directory, rules):
+    """Return True if path is ignored by the gitignore_rules() in rules.
+
+    The last rule that matches decides.
+    """
+    for (directory, prefix, pattern, anchored, directory_only,
+         negated) in reversed(rules):
+        if directory_only and not is_directory:
+            continue
+        if anchored:
+            target = prefix + path[len(directory):].lstrip(os.sep).replace(
+                os.sep, '/')
+        else:
+            target = name
+        if fnmatch.fnmatchcase(target, pattern):
+            return not negated
+    return False
+
+
+def git(*arguments):
+    """Return standard output of git run with arguments."""
+    import subprocess
+    return subprocess.run(('git',) + arguments, check=True,
+                          capture_output=True, encoding='utf-8',
+                          errors='surrogateescape').stdout
+
+
+HUNK_REGEX = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@',
+                        flags=re.MULTILINE)
+
+
+def git_changed_lines(base, pathspecs=()):
+    """Return dictionary of Python files changed since base.
+
+    Each filename, relative to the current directory, maps to the set of
+    line numbers changed since base, or to None for untracked files. Only
+    git is asked; the files themselves are not opened.
+    """
+    top = git('rev-parse', '--show-toplevel').rstrip('\n')
+    patch = git('-c', 'core.quotePath=off', 'diff', '-U0', '--no-color',
+                '--no-ext-diff', '--no-prefix', base, '--', *pathspecs)
+
+    changed = {}
+    lines = None
+    for line in patch.splitlines():
+        if line.startswith('+++ '):
+            name = line[4:].rstrip('\t')
+            if name.endswith('.py') and name != '/dev/null':
+                lines = changed.setdefault(
+                    os.path.relpath(os.path.join(top, name)), set())
+            else:
+                lines = None
+        elif lines is not None and line.startswith('@@'):
+            match = HUNK_REGEX.match(line)
+            start = int(match.group(1))
+            count = int(match.group(2) or 1)
+            lines.update(range(start, start + count))
+
+    # Without pathspecs, list the whole work tree, as git diff does.
+    for name in git('ls-files', '-z', '--others', '--exclude-standard',
+                    '--full-name', '--',
+                    *(pathspecs or [':/'])).split('\0'):
+        if name.endswith('.py'):
+            changed[os.path.relpath(os.path.join(top, name))] = None
+
+    return changed
+
+
+def skip_index_path():
+    """Return path of the SkipIndex of the current git repository.
+
+    It is kept in the git directory, so it is never committed. Return None
+    outside of a git repository.
+    """
+    import subprocess
+    try:
+        directory = git('rev-parse', '--absolute-git-dir').rstrip('\n')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return os.path.join(directory, 'eradicate-index')
+
+
+def create_eradicator(args):
+    """Return Eradicator configured from command-line arguments."""
+    eradicator = Eradicator(config=Config(aggressive=args.aggressive))
+
+    if args.whitelist_extend:
+        eradicator.update_whitelist(args.whitelist_extend.split('#'), True)
+    elif args.whitelist:
+        eradicator.update_whitelist(args.whitelist.split('#'), False)
+
+    if args.cache_dir:
+        eradicator.cache = ResultCache(args.cache_dir, args.cache_size)
+
+    return eradicator
+
+
+_worker = {}
+
+
+def _initialize_worker(args):
+    """Set up the Eradicator used by a worker process."""
+    _worker['args'] = args
+    _worker['eradicator'] = create_eradicator(args)
+
+
+def _fix_file_in_worker(filename, lines=None):
+    """Run fix_file() in a worker process and return its outcome."""
+    eradicator = _worker['eradicator']
+    if _worker['args'].stats:
+        eradicator.stats = Statistics()
+    output = io.StringIO()
+    if _worker['args'].format != 'diff' and not _worker['args'].in_place:
+        # Written again in the chosen format by the parent process.
+        eradicator.report = Report('json', output)
+    try:
+        changed = eradicator.fix_file(
+            filename, args=_worker['args'], standard_out=output,
+            lines=lines)
+    except OSError as exception:
+        return True, output.getvalue(), f'{exception}', eradicator.stats
+    return bool(changed), output.getvalue(), None, eradicator.stats
+
+
+def fix_files_in_parallel(filenames, args, standard_out, standard_error,
+                          stats=None, lines=None, report=None, index=None):
+    """Run fix_file() on files using a pool of worker processes.
+
+    Output is written in the order of filenames, so it is the same as in a
+    serial run over the same filenames. Statistics of the workers are added
+    to stats. lines may map filenames to the line numbers passed to
+    fix_file(). Findings are added to report if it is given. Verdicts of
+    whole files are recorded in index if it is given.
+    """
+    import concurrent.futures
+    lines = lines or {}
+    chunksize = max(1, len(filenames) // (args.jobs * 4))
+    change_or_error = False
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.jobs,
+            initializer=_initialize_worker,
+            initargs=(args,)) as executor:
+        for name, (changed, output, error, worker_stats) in zip(
+                filenames, executor.map(
+                    _fix_file_in_worker, filenames,
+                    [lines.get(name) for name in filenames],
+                    chunksize=chunksize)):
+            if worker_stats is not None and stats is not None:
+                stats.update(worker_stats)
+            if report is not None:
+                for line in output.splitlines():
+                    report.add(Finding(**json.loads(line)))
+            elif output:
+                standard_out.write(output)
+            if error is not None:
+                print(error, file=standard_error)
+            elif index is not None and lines.get(name) is None:
+                index.record(name, clean=not changed)
+            change_or_error = changed or change_or_error
+    return change_or_error
+
+
+def jobs(value):
+    """Return number of jobs from "auto" or a positive integer string."""
+    if value == 'auto':
+        return os.cpu_count() or 1
+    number = int(value)
+    if number < 1:
+        raise ValueError(value)
+    return number
+
+
+def create_parser():
+    """Return parser of command-line arguments."""
     import argparse
     parser = argparse.ArgumentParser(description=__doc__, prog='eradicate')
     parser.add_argument('-i', '--in-place', action='store_true',
-                        help='make changes to files instead of printing diffs')
+                        help='make changes to files instead of printing '
+                             'diffs; for standard input, print the changed '
+                             'source')
     parser.add_argument('-r', '--recursive', action='store_true',
                         help='drill down directories recursively')
+    parser.add_argument('--exclude', default=','.join(DEFAULT_EXCLUDE),
+                        help='comma-separated globs of files and '
+                             'directories to skip when drilling down '
+                             '(default: %(default)s)')
+    parser.add_argument('--extend-exclude', default='',
+                        help='comma-separated globs to skip in addition to '
+                             '--exclude')
     parser.add_argument('-a', '--aggressive', action='store_true',
                         help='make more aggressive changes; '
                              'this may result in false positives')
     parser.add_argument('-e', '--error', action="store_true",
                         help="Exit code based on result of check")
+    parser.add_argument('--format', default='diff',
+                        choices=('diff',) + Report.FORMATS,
+                        help='without --in-place, print a diff, or print '
+                             'each line of commented-out code as a text '
+                             'line, a JSON line or a result of a SARIF log '
+                             '(default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=jobs, default=1,
+                        help='number of parallel jobs; '
+                             'use "auto" for the number of CPUs')
+    parser.add_argument('--diff-base', metavar='REF',
+                        help='only check Python files that git reports as '
+                             'changed since REF or untracked; files act as '
+                             'git pathspecs')
+    parser.add_argument('--only-changed-lines', action='store_true',
+                        help='with --diff-base, only remove commented-out '
+                             'code on lines changed since REF')
+    parser.add_argument('--cache-dir',
+                        help='directory in which to cache results of '
+                             'unchanged files')
+    parser.add_argument('--cache-size', type=int, default=50000,
+                        help='maximum number of files kept in the cache '
+                             '(default: %(default)s)')
+    parser.add_argument('--no-index', action='store_true',
+                        help='check all files, also those that are '
+                             'unchanged since an earlier run found them '
+                             'clean according to the index in the git '
+                             'directory')
+    parser.add_argument('--stats', nargs='?', const='text',
+                        choices=['text', 'json'],
+                        help='print statistics about where time goes to '
+                             'standard error at the end')
     parser.add_argument('--version', action='version',
                         version='%(prog)s ' + __version__)
     parser.add_argument('--whitelist', action="store",
@@ -275,38 +1901,250 @@ def main(argv=sys.argv, standard_out=sys.stdout, standard_error=sys.stderr):
                             'Overwrites --whitelist. '
                             'EXTENDING the default whitelist: {} '
                         ).format(Eradicator.DEFAULT_WHITELIST))
-    parser.add_argument('files', nargs='+', help='files to format')
-
-    args = parser.parse_args(argv[1:])
+    parser.add_argument('--server', metavar='SOCKET',
+                        help='serve requests of --connect clients on a '
+                             'Unix socket instead of checking files')
+    parser.add_argument('--connect', metavar='SOCKET',
+                        help='forward this run to the server listening on '
+                             'the Unix socket')
+    parser.add_argument('files', nargs='*',
+                        help='files to format; '
+                             'use "-" to read from standard input')
 
-    eradicator = Eradicator()
+    return parser
 
-    if args.whitelist_extend:
-        eradicator.update_whitelist(args.whitelist_extend.split('#'), True)
-    elif args.whitelist:
-        eradicator.update_whitelist(args.whitelist.split('#'), False)
 
-    filenames = list(set(args.files))
+def fix_files(args, eradicator, standard_out, standard_error, standard_input):
+    """Run eradicator on files as requested by command-line arguments."""
+    import subprocess
+    eradicator.stats = Statistics() if args.stats else None
     change_or_error = False
-    while filenames:
-        name = filenames.pop(0)
-        if args.recursive and os.path.isdir(name):
-            for root, directories, children in os.walk(f'{name}'):
-                filenames += [os.path.join(root, f) for f in children
-                              if f.endswith('.py') and
-                              not f.startswith('.')]
-                directories[:] = [d for d in directories
-                                  if not d.startswith('.')]
+
+    # Remove duplicates, keeping the order of the arguments.
+    files = dict.fromkeys(args.files)
+    standard_input_file = '-' in files
+    files.pop('-', None)
+
+    lines = {}
+    if args.diff_base:
+        try:
+            lines = git_changed_lines(args.diff_base, list(files))
+        except subprocess.CalledProcessError as exception:
+            print(exception.stderr.rstrip(), file=standard_error)
+            return 1
+        except OSError as exception:
+            print(f'{exception}', file=standard_error)
+            return 1
+        if args.only_changed_lines:
+            lines = {name: numbers for name, numbers in lines.items()
+                     if numbers is None or numbers}
         else:
+            lines = dict.fromkeys(lines)
+        filenames = sorted(lines)
+    else:
+        exclude = [pattern.strip() for pattern in
+                   (args.exclude + ',' + args.extend_exclude).split(',')
+                   if pattern.strip()]
+        filenames = find_files(files, args.recursive, exclude)
+
+    # Only whole files are recorded, so without them the index is not used.
+    if args.diff_base:
+        whole_files = None in lines.values()
+    else:
+        whole_files = bool(files)
+    index = None
+    if whole_files and not args.no_index:
+        path = skip_index_path()
+        if path is not None:
+            # Verdicts rely on compile(), so they depend on the interpreter.
+            index = SkipIndex(path, repr((
+                __version__, sys.implementation.cache_tag,
+                eradicator.config._replace(aggressive=args.aggressive))))
+            index.load()
+            filenames = (name for name in filenames if index.changed(name))
+
+    if args.format == 'diff' or args.in_place:
+        eradicator.report = None
+    else:
+        eradicator.report = Report(args.format, standard_out)
+        eradicator.report.start()
+
+    if standard_input_file:
+        change_or_error = eradicator.fix_standard_input(
+            standard_input, args=args, standard_out=standard_out)
+
+    if args.jobs > 1:
+        # Workers are given chunks of a known number of files.
+        filenames = list(filenames)
+
+    if args.jobs > 1 and len(filenames) > 1:
+        change_or_error = fix_files_in_parallel(
+            filenames, args=args, standard_out=standard_out,
+            standard_error=standard_error,
+            stats=eradicator.stats, lines=lines,
+            report=eradicator.report, index=index) or change_or_error
+    else:
+        for name in filenames:
             try:
-                change_or_error = eradicator.fix_file(name, args=args, standard_out=standard_out) or change_or_error
+                changed = eradicator.fix_file(
+                    name, args=args, standard_out=standard_out,
+                    lines=lines.get(name))
             except OSError as exception:
                 print(f'{exception}', file=standard_error)
                 change_or_error = True
+                continue
+            if index is not None and lines.get(name) is None:
+                index.record(name, clean=not changed)
+            change_or_error = changed or change_or_error
+
+    if eradicator.report is not None:
+        eradicator.report.finish()
+
+    if index is not None:
+        index.save()
+        if eradicator.stats is not None and index.hits:
+            eradicator.stats.counts['index-hit'] += index.hits
+
+    if args.cache_dir:
+        ResultCache(args.cache_dir, args.cache_size).maybe_prune()
+
+    if args.stats == 'json':
+        print(json.dumps(eradicator.stats.as_dict(), indent=2),
+              file=standard_error)
+    elif args.stats:
+        print(eradicator.stats.format(), file=standard_error)
 
     if change_or_error and args.error:
         return 1
 
 
+class EradicatorService:
+    """Run requests of clients, keeping a warm Eradicator between them.
+
+    The Eradicator is recreated whenever the options it is configured from
+    change.
+    """
+
+    def __init__(self):
+        self.eradicator = None
+        self.options = None
+
+    def eradicator_for(self, args):
+        """Return Eradicator configured for args."""
+        options = (args.whitelist, args.whitelist_extend,
+                   args.cache_dir, args.cache_size)
+        if options != self.options:
+            self.eradicator = create_eradicator(args)
+            self.options = options
+        return self.eradicator
+
+    def run(self, request):
+        """Return response to a request as sent by connect()."""
+        standard_out = io.StringIO()
+        standard_error = io.StringIO()
+        directory = os.getcwd()
+        try:
+            with contextlib.redirect_stdout(standard_out), \
+                    contextlib.redirect_stderr(standard_error):
+                args = create_parser().parse_args(request['argv'][1:])
+            os.chdir(request['cwd'])
+            returncode = fix_files(
+                args, self.eradicator_for(args),
+                standard_out=standard_out,
+                standard_error=standard_error,
+                standard_input=io.StringIO(request['stdin'] or ''))
+        except SystemExit as exception:
+            returncode = exception.code
+        except Exception:  # pylint: disable=broad-except
+            # Report it to the client rather than leave it without a response.
+            import traceback
+            standard_error.write(traceback.format_exc())
+            returncode = 1
+        finally:
+            os.chdir(directory)
+        return {'stdout': standard_out.getvalue(),
+                'stderr': standard_error.getvalue(),
+                'returncode': returncode}
+
+
+def create_server(path):
+    """Return server that runs requests on a Unix socket at path."""
+    import socket
+    import socketserver
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        """Handle one JSON request per connection."""
+
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            response = self.server.service.run(request)
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+    if os.path.exists(path):
+        try:
+            with socket.socket(socket.AF_UNIX) as client:
+                client.connect(path)
+        except ConnectionRefusedError:
+            # Left behind by a server that is no longer running.
+            os.remove(path)
+
+    server = socketserver.UnixStreamServer(path, RequestHandler)
+    server.service = EradicatorService()
+    return server
+
+
+def connect(path, args, argv, standard_out, standard_error, standard_input):
+    """Run argv on the server at path and return its exit code."""
+    import socket
+    request = {'argv': argv,
+               'cwd': os.getcwd(),
+               'stdin': standard_input.read() if '-' in args.files else None}
+    with socket.socket(socket.AF_UNIX) as client:
+        client.connect(path)
+        client.sendall(json.dumps(request).encode() + b'\n')
+        with client.makefile('rb') as response_file:
+            line = response_file.readline()
+    if not line:
+        print(f'eradicate: no response from server at {path}',
+              file=standard_error)
+        return 1
+    response = json.loads(line)
+
+    standard_out.write(response['stdout'])
+    if response['stderr']:
+        print(response['stderr'], end='', file=standard_error)
+    return response['returncode']
+
+
+def main(argv=sys.argv, standard_out=sys.stdout, standard_error=sys.stderr,
+         standard_input=sys.stdin):
+    """Main entry point."""
+    parser = create_parser()
+    args = parser.parse_args(argv[1:])
+
+    if args.server:
+        server = create_server(args.server)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.remove(args.server)
+        return None
+
+    if not args.files and not args.diff_base:
+        parser.error('the following arguments are required: files')
+
+    if args.connect:
+        return connect(args.connect, args, argv,
+                       standard_out=standard_out,
+                       standard_error=standard_error,
+                       standard_input=standard_input)
+
+    return fix_files(args, create_eradicator(args),
+                     standard_out=standard_out,
+                     standard_error=standard_error,
+                     standard_input=standard_input)
+
+
 if __name__ == '__main__':
     main()
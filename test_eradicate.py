@@ -2,12 +2,23 @@
 
 """Test suite for eradicate."""
 
+import asyncio
+import concurrent.futures
 import contextlib
+import difflib
 import io
+import json
+import os
+import random
+import shutil
+import socket
+import socketserver
 import subprocess
 import sys
 import tempfile
+import threading
 import unittest
+import warnings
 import unittest.mock as mock
 import re
 
@@ -132,6 +143,27 @@ class UnitTests(unittest.TestCase):
         self.assertFalse(eradicate.Eradicator().comment_contains_code(
             '#code is good'))
 
+    def test_prose_case(self):
+        self.assertTrue(eradicate.Eradicator().prose_case(
+            'see foo(bar) for details'))
+
+        self.assertTrue(eradicate.Eradicator().prose_case(
+            'x = this works'))
+
+        self.assertFalse(eradicate.Eradicator().prose_case(
+            'from foo import bar'))
+
+        self.assertFalse(eradicate.Eradicator().prose_case(
+            'x = y if z else w'))
+
+        self.assertFalse(eradicate.Eradicator().prose_case(
+            'x = "two words"'))
+
+        if sys.version_info >= (3, 10):
+            # match is a soft keyword since Python 3.10.
+            self.assertFalse(eradicate.Eradicator().prose_case(
+                'match x:'))
+
     def test_comment_contains_code_with_encoding(self):
         self.assertFalse(eradicate.Eradicator().comment_contains_code(
             '# coding=utf-8'))
@@ -332,6 +364,88 @@ def foo():
 #     oops = x.ham
 """)))
 
+    def test_commented_out_code_line_numbers_without_candidates(self):
+        with mock.patch('tokenize.generate_tokens') as mock_tokenize:
+            self.assertEqual(
+                [],
+                list(eradicate.Eradicator().commented_out_code_line_numbers(
+                    """\
+# This is a comment.
+x = foo(1)  # Another comment
+""")))
+        self.assertFalse(mock_tokenize.called)
+
+    def test_scan(self):
+        source = """\
+# print(5)
+# This is a comment.
+# x = 1
+
+y = 1  # x = 3
+
+# The below is another comment.
+# 3 / 2 + 21
+"""
+        scan = eradicate.Eradicator().scan(source)
+        self.assertEqual({1, 3}, scan.marked_lines)
+        self.assertTrue(scan.complete)
+
+    def test_rescan(self):
+        eradicator = eradicate.Eradicator()
+        scan = eradicator.scan("""\
+x = 1
+# y = 2
+z = 3
+# y = 4
+w = 5
+""")
+        self.assertEqual({2, 4}, scan.marked_lines)
+
+        # Opening a string hides the following comments.
+        scan = eradicator.rescan(scan, """\
+x = 1
+# y = 2
+z = '''
+# y = 4
+'''
+w = 5
+""", (2, 4, 5))
+        self.assertEqual({2}, scan.marked_lines)
+
+        scan = eradicator.rescan(scan, """\
+# x = 0
+x = 1
+# y = 2
+z = '''
+# y = 4
+'''
+w = 5
+# y = 6
+""")
+        self.assertEqual({1, 3, 8}, scan.marked_lines)
+
+    def test_rescan_is_same_as_scan(self):
+        pieces = ['# x = 1\n', '# This is prose.\n', 'x = 1\n', 'def f():\n',
+                  '    # y = 3\n', 's = """\n', '"""\n', 'a = (\n', ')\n',
+                  '\n', 'x = 1 \\\n', '# /// script\n', '# ///\n', '  z = 1\n']
+        eradicator = eradicate.Eradicator()
+        rng = random.Random(0)
+        for _ in range(200):
+            scan = eradicator.scan(''.join(rng.choice(pieces)
+                                           for _ in range(rng.randint(0, 20))))
+            for _ in range(3):
+                start = rng.randint(0, len(scan.lines))
+                old_stop = rng.randint(start, min(len(scan.lines), start + 3))
+                inserted = [rng.choice(pieces)
+                            for _ in range(rng.randint(0, 3))]
+                source = ''.join(scan.lines[:start] + inserted +
+                                 scan.lines[old_stop:])
+                scan = eradicator.rescan(
+                    scan, source, (start, old_stop, start + len(inserted)))
+                self.assertEqual(
+                    set(eradicator.commented_out_code_line_numbers(source)),
+                    scan.marked_lines)
+
     def test_filter_commented_out_code(self):
         self.assertEqual(
             """\
@@ -403,6 +517,31 @@ y = 1  # x = 3
             ''.join(eradicate.Eradicator().filter_commented_out_code(code,
                                                         aggressive=False)))
 
+    def test_unified_diff(self):
+        eradicator = eradicate.Eradicator()
+        rng = random.Random(0)
+        for _ in range(500):
+            # Unique lines, so that difflib finds the same changes.
+            lines = [rng.choice(['x = {0}\n', '# x = {0}\n',
+                                 'x{0}\x0cy{0}\n', '# y{0}\r{0}\r\n',
+                                 'x = {0} \\\n'])
+                     .format(number)
+                     for number in range(rng.randint(0, 30))]
+            source = ''.join(lines)
+            marked_lines = [number for number in range(1, len(lines) + 1)
+                            if rng.random() < 0.2]
+            filtered_source = ''.join(eradicator.filter_commented_out_code(
+                source, marked_lines=marked_lines))
+
+            expected = ''.join(
+                line + '\n' for line in difflib.unified_diff(
+                    source.splitlines(), filtered_source.splitlines(),
+                    'before/example.py', 'after/example.py', lineterm=''))
+            self.assertEqual(
+                expected,
+                ''.join(eradicator.unified_diff(source, marked_lines,
+                                                'example.py')))
+
     def test_filter_commented_out_code_with_annotation(self):
         self.assertEqual(
             '\n\n\n',
@@ -426,6 +565,20 @@ y = 1  # x = 3
             self.assertEqual('latin-1',
                              eradicate.Eradicator().detect_encoding(filename))
 
+    def test_read_with_encoding(self):
+        with temporary_file('# x = 1\r\ny = "\xe9"\r\n') as filename:
+            self.assertEqual(('# x = 1\r\ny = "\xe9"\r\n', 'utf-8'),
+                             eradicate.Eradicator().read_with_encoding(
+                                 filename))
+
+    def test_read_with_encoding_with_invalid_data(self):
+        with temporary_file('') as filename:
+            with open(filename, 'wb') as f:
+                f.write(b'# x = 1\ny = "\xe9"\n')
+            self.assertEqual(('# x = 1\ny = "\xe9"\n', 'latin-1'),
+                             eradicate.Eradicator().read_with_encoding(
+                                 filename))
+
     def test_extend_whitelist(self):
         eradicator = eradicate.Eradicator()
         eradicator.update_whitelist(["foo"], True)
@@ -440,6 +593,191 @@ y = 1  # x = 3
         eradicator.update_whitelist(["foo"], False)
         self.assertTrue(eradicator.WHITELIST_REGEX == re.compile("foo", flags=re.IGNORECASE))
 
+    def test_comment_contains_code_memo(self):
+        eradicator = eradicate.Eradicator(memo_size=2)
+        self.assertTrue(eradicator.comment_contains_code('# foo = 1'))
+        self.assertTrue(eradicator.comment_contains_code('  #foo = 1 '))
+        self.assertTrue(eradicator.comment_contains_code('# foo = 1', False))
+        self.assertEqual((1, 2, 2, 2), tuple(eradicator.memo_info()))
+
+        eradicator.update_whitelist(['foo'], True)
+        self.assertFalse(eradicator.comment_contains_code('# foo = 1'))
+        self.assertEqual(1, eradicator.memo_info().currsize)
+
+    def test_config(self):
+        config = eradicate.Config(whitelist=('foo',), aggressive=False,
+                                  code_keywords=('else', 'while .*'))
+        eradicator = eradicate.Eradicator(config=config)
+        self.assertIs(config, eradicator.config)
+        self.assertIs(eradicator.WHITELIST_REGEX,
+                      eradicate.Eradicator(config=config).WHITELIST_REGEX)
+        self.assertFalse(eradicator.comment_contains_code('# foo = 1'))
+        self.assertTrue(eradicator.comment_contains_code('# while x:'))
+        self.assertFalse(eradicator.comment_contains_code('#if x:'))
+        self.assertTrue(eradicator.comment_contains_code('#if x:', True))
+
+        eradicator.update_whitelist(['bar'], False)
+        self.assertEqual(config._replace(whitelist=('bar',)),
+                         eradicator.config)
+
+    def test_config_with_lists(self):
+        config = eradicate.Config(whitelist=['foo'], code_keywords=['else'])
+        self.assertEqual(eradicate.Config(whitelist=('foo',),
+                                          code_keywords=('else',)), config)
+        self.assertEqual(('bar',),
+                         config._replace(whitelist=['bar']).whitelist)
+        eradicator = eradicate.Eradicator(config=config)
+        self.assertFalse(eradicator.comment_contains_code('# foo = 1'))
+        self.assertTrue(eradicator.comment_contains_code('#else:', False))
+
+    def test_config_with_threads(self):
+        eradicator = eradicate.Eradicator(memo_size=8)
+        configs = [eradicate.Config(), eradicate.Config(whitelist=('x',))]
+        lines = [f'# x{number} = 1' for number in range(20)]
+        failures = []
+
+        def classify():
+            for _ in range(200):
+                verdicts = eradicator.classify_comments(lines)
+                if verdicts not in ([True] * 20, [False] * 20):
+                    failures.append(verdicts)
+
+        threads = [threading.Thread(target=classify) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for number in range(200):
+            eradicator.configure(configs[number % 2])
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], failures)
+
+    def test_classify_comment(self):
+        eradicator = eradicate.Eradicator()
+        self.assertEqual('hash-number',
+                         eradicator.classify_comment('# Issue #999: x = 1'))
+        self.assertEqual('whitelist',
+                         eradicator.classify_comment('# noqa: x = 1'))
+        self.assertEqual('no-indicator',
+                         eradicator.classify_comment('# code is good'))
+        self.assertEqual('multiline', eradicator.classify_comment('#x = foo('))
+        self.assertEqual('keyword', eradicator.classify_comment('#else:'))
+        self.assertEqual('compile', eradicator.classify_comment('# x = 1'))
+        self.assertEqual('not-comment', eradicator.classify_comment('x = 1'))
+
+    def test_classify_comments(self):
+        lines = ['# x = 1', 'x = 1', '# Issue #999: x = 1', '# noqa: x = 1',
+                 '# coding: utf-8', '# code is good', '#else:', '#x = foo(',
+                 '# x = 1', '# foo = 1', '#if x:']
+        eradicator = eradicate.Eradicator()
+        for aggressive in [True, False]:
+            self.assertEqual(
+                [eradicator.comment_contains_code(line, aggressive)
+                 for line in lines],
+                eradicator.classify_comments(iter(lines), aggressive))
+
+        eradicator.update_whitelist(['foo'], True)
+        self.assertEqual([True, False],
+                         eradicator.classify_comments(['# x = 1',
+                                                       '# foo = 1']))
+
+    def test_structure_regex(self):
+        fragments = ['x', ' = ', '1', '(', ')', '[', ']', '{', '}', ':', ',',
+                     '\\', '\t', '\r', '\n', '\u3000', ' ', '#', '#1', '"',
+                     'print', 'return', 'else', 'try', 'pass', 'foo.bar',
+                     'def f', ' -> int', 'with a as b', 'for i in x',
+                     'except Exception', 'if x', 'coding: utf-8', 'noqa',
+                     'NOQA', 'TODO', '}:', '),']
+        rng = random.Random(0)
+        for config in [eradicate.Config(),
+                       eradicate.Config(code_keywords=('else', 'while .*'))]:
+            eradicator = eradicate.Eradicator(config=config)
+            patterns = eradicate.compile_config(config)
+            self.assertIsNotNone(patterns.structure)
+            cascade = patterns._replace(structure=None,
+                                        structure_aggressive=None)
+            for _ in range(3000):
+                line = ''.join(rng.choice(fragments)
+                               for _ in range(rng.randrange(1, 8)))
+                self.assertEqual(
+                    any(symbol in line
+                        for symbol in eradicate.Eradicator.CODE_INDICATORS),
+                    bool(eradicate.Eradicator.CODE_INDICATOR_REGEX.search(
+                        line)))
+                for aggressive in [True, False]:
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('ignore', SyntaxWarning)
+                        self.assertEqual(
+                            eradicator._classify(cascade, line, aggressive),
+                            eradicator._classify(patterns, line, aggressive),
+                            (line, aggressive))
+
+        config = eradicate.Config(code_keywords=('(?P<keyword>else)',))
+        self.assertIsNone(eradicate.compile_config(config).structure)
+        eradicator = eradicate.Eradicator(config=config)
+        self.assertEqual('keyword', eradicator.classify_comment('# else:'))
+        self.assertEqual('multiline', eradicator.classify_comment('#x = ('))
+
+    def test_statistics(self):
+        eradicator = eradicate.Eradicator()
+        eradicator.stats = eradicate.Statistics(slowest=1)
+        self.assertEqual(
+            [1, 3],
+            list(eradicator.commented_out_code_line_numbers("""\
+# x = 1
+# This is a comment.
+# x = 1
+# noqa: x = 1
+""")))
+        self.assertEqual({'compile': 2, 'memo-hit': 1, 'no-indicator': 1,
+                          'whitelist': 1},
+                         dict(eradicator.stats.counts))
+        self.assertIn('compile', eradicator.stats.times)
+
+        other = eradicate.Statistics()
+        other.add_file('foo.py', 2.0)
+        other.add_file('bar.py', 1.0)
+        eradicator.stats.update(other)
+        self.assertEqual(2, eradicator.stats.files)
+        self.assertEqual([{'filename': 'foo.py', 'seconds': 2.0}],
+                         eradicator.stats.as_dict()['slowest'])
+
+    def test_result_cache(self):
+        with temporary_directory() as directory:
+            cache = eradicate.ResultCache(directory, max_entries=2)
+            key = cache.key('# x = 1\n', True, 'foo')
+            self.assertIsNone(cache.get(key))
+            cache.set(key, [1])
+            self.assertEqual([1], cache.get(key))
+
+            self.assertNotEqual(key, cache.key('# x = 1\n', False, 'foo'))
+            self.assertNotEqual(key, cache.key('# x = 1\n', True, 'bar'))
+            self.assertNotEqual(key, cache.key('# x = 2\n', True, 'foo'))
+            with mock.patch.object(sys.implementation, 'cache_tag',
+                                   'other-interpreter'):
+                self.assertNotEqual(key,
+                                    cache.key('# x = 1\n', True, 'foo'))
+
+            os.utime(cache.path(key), ns=(0, 0))
+            for time, source in enumerate(['a = 1\n', 'b = 2\n', 'c = 3\n'],
+                                          start=1):
+                cache.set(cache.key(source, True, 'foo'), [])
+                os.utime(cache.path(cache.key(source, True, 'foo')),
+                         ns=(time, time))
+            cache.prune()
+            self.assertIsNone(cache.get(key))
+            self.assertEqual([], cache.get(cache.key('c = 3\n', True, 'foo')))
+
+        with temporary_directory() as directory:
+            cache = eradicate.ResultCache(directory, max_entries=10)
+            for source in ['a = 1\n', 'b = 2\n', 'c = 3\n']:
+                cache.set(cache.key(source, True, 'foo'), [])
+            with mock.patch.object(cache, 'prune') as prune:
+                cache.maybe_prune()
+                self.assertFalse(prune.called)
+                cache.max_entries = 1
+                cache.maybe_prune()
+                self.assertTrue(prune.called)
+
     def test_inline_script_metadata(self):
         self.assertEqual(
             """\
@@ -476,9 +814,37 @@ data = resp.json()
 pprint([(k, v["title"]) for k, v in data.items()][:10])
 """)))
 
+    def test_inline_script_metadata_ranges(self):
+        block = '# /// script\n# dependencies = []\n# ///\n'
+        source = 'x = 1\n' + block + '\n# x = 2\n' * 3 + block
+        eradicator = eradicate.Eradicator()
+        expected = [range(1, 4), range(10, 13)]
+        self.assertEqual(expected,
+                         eradicator.inline_script_metadata_ranges(source))
+        self.assertEqual(
+            expected,
+            eradicator.inline_script_metadata_ranges(source.encode()))
+        self.assertEqual({1, 2, 3, 10, 11, 12},
+                         eradicator.inline_script_metadata_rows(source))
+        self.assertEqual([],
+                         eradicator.inline_script_metadata_ranges('x = 1\n'))
+
 
 class SystemTests(unittest.TestCase):
 
+    def setUp(self):
+        # Run in a directory outside of any git repository, so that no skip
+        # index is shared with other runs.
+        working_directory = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, working_directory)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(working_directory)
+        environment = mock.patch.dict(
+            os.environ,
+            GIT_CEILING_DIRECTORIES=os.path.dirname(working_directory))
+        environment.start()
+        self.addCleanup(environment.stop)
+
     def test_diff(self):
         with temporary_file("""\
 # x * 3 == False
@@ -514,6 +880,108 @@ class SystemTests(unittest.TestCase):
  # x is a variable
 """, '\n'.join(output_file.getvalue().split('\n')[2:]))
 
+    def test_jobs(self):
+        with temporary_directory() as directory:
+            for contents in ['# x * 3 == False\n# x is a variable\n',
+                             '# x is a variable\n',
+                             'x = 1\n# print(x)\n']:
+                with open(tempfile.mktemp(suffix='.py', dir=directory),
+                          'w') as f:
+                    f.write(contents)
+            # Sorts before the files above, but is found in a subdirectory.
+            os.mkdir(os.path.join(directory, 'a'))
+            with open(os.path.join(directory, 'a', 'b.py'), 'w') as f:
+                f.write('# x = 1\n')
+
+            serial_output = io.StringIO()
+            serial_result = eradicate.main(argv=['my_fake_program',
+                                                 '--recursive', '-e',
+                                                 directory],
+                                           standard_out=serial_output,
+                                           standard_error=None)
+
+            parallel_output = io.StringIO()
+            parallel_result = eradicate.main(argv=['my_fake_program',
+                                                   '--recursive', '-e',
+                                                   '--jobs', '2',
+                                                   directory],
+                                             standard_out=parallel_output,
+                                             standard_error=None)
+
+            self.assertEqual(1, serial_result)
+            self.assertEqual(serial_result, parallel_result)
+            self.assertEqual(
+                sorted(serial_output.getvalue().split('--- ')),
+                sorted(parallel_output.getvalue().split('--- ')))
+            for output in [serial_output, parallel_output]:
+                self.assertEqual(
+                    sorted(re.findall('before/(.*)', output.getvalue())),
+                    re.findall('before/(.*)', output.getvalue()))
+
+    def test_jobs_with_missing_file(self):
+        output_file = io.StringIO()
+        ignore = StubFile()
+        result = eradicate.main(argv=['my_fake_program', '--jobs', 'auto',
+                                      '-e', '.fake', '.fake2'],
+                                standard_out=output_file,
+                                standard_error=ignore)
+        self.assertEqual(1, result)
+        self.assertFalse(output_file.getvalue())
+
+    def test_cache_dir(self):
+        with temporary_directory() as directory:
+            with temporary_file("""\
+# x * 3 == False
+# x is a variable
+""") as filename:
+                first_output = io.StringIO()
+                eradicate.main(argv=['my_fake_program', '--cache-dir',
+                                     directory, filename],
+                               standard_out=first_output,
+                               standard_error=None)
+
+                second_output = io.StringIO()
+                with mock.patch.object(
+                        eradicate.Eradicator,
+                        'commented_out_code_line_numbers') as mock_find:
+                    eradicate.main(argv=['my_fake_program', '--cache-dir',
+                                         directory, filename],
+                                   standard_out=second_output,
+                                   standard_error=None)
+                self.assertFalse(mock_find.called)
+                self.assertEqual(first_output.getvalue(),
+                                 second_output.getvalue())
+                self.assertIn('-# x * 3 == False', second_output.getvalue())
+
+    def test_stats(self):
+        with temporary_file("""\
+# x * 3 == False
+# x is a variable
+""") as filename:
+            output_file = io.StringIO()
+            error_file = io.StringIO()
+            eradicate.main(argv=['my_fake_program', '--stats', 'json',
+                                 filename],
+                           standard_out=output_file,
+                           standard_error=error_file)
+            stats = json.loads(error_file.getvalue())
+            self.assertEqual(1, stats['files'])
+            self.assertEqual({'compile': 1, 'no-indicator': 1},
+                             stats['counts'])
+            self.assertEqual(filename, stats['slowest'][0]['filename'])
+            for stage in ['read', 'tokenize', 'classify', 'compile',
+                          'diff']:
+                self.assertIn(stage, stats['times'])
+
+            # Findings do not count the comments again.
+            error_file = io.StringIO()
+            eradicate.main(argv=['my_fake_program', '--stats', 'json',
+                                 '--format', 'lines', filename],
+                           standard_out=io.StringIO(),
+                           standard_error=error_file)
+            self.assertEqual({'compile': 1, 'no-indicator': 1},
+                             json.loads(error_file.getvalue())['counts'])
+
     def test_ignore_hidden_directories(self):
         with temporary_directory() as directory:
             with temporary_directory(prefix='.',
@@ -534,6 +1002,70 @@ class SystemTests(unittest.TestCase):
                         '',
                         output_file.getvalue().strip())
 
+    def test_exclude(self):
+        with temporary_directory() as directory:
+            for name in ['a.py', 'build/b.py', 'sub/c.py', 'sub/skip_d.py',
+                         'sub/generated_e.py', 'sub/anchored/f.py',
+                         'sub/other/anchored/g.py', 'sub/other/h.py',
+                         'sub/other/generated_i.py', 'sub/drop_pb2.py',
+                         'sub/keep_pb2.py']:
+                path = os.path.join(directory, *name.split('/'))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w') as output_file:
+                    output_file.write('# x = 1\n')
+            with open(os.path.join(directory, 'sub', '.gitignore'),
+                      'w') as output_file:
+                output_file.write('# Comment\ngenerated_*.py\n/anchored/\n'
+                                  '*_pb2.py\n!keep_pb2.py\n')
+            with open(os.path.join(directory, 'sub', 'other', '.gitignore'),
+                      'w') as output_file:
+                output_file.write('!generated_i.py\n')
+
+            self.assertEqual(
+                ['a.py', 'sub/c.py', 'sub/keep_pb2.py',
+                 'sub/other/anchored/g.py', 'sub/other/generated_i.py',
+                 'sub/other/h.py'],
+                [os.path.relpath(name, directory).replace(os.sep, '/')
+                 for name in eradicate.find_files(
+                     [directory], True, ['build', 'skip_*'])])
+
+            output_file = io.StringIO()
+            eradicate.main(argv=['my_fake_program', '--recursive',
+                                 '--extend-exclude', 'sub', directory],
+                           standard_out=output_file,
+                           standard_error=None)
+            self.assertEqual(1, output_file.getvalue().count('--- before/'))
+
+    def test_exclude_from_above(self):
+        with temporary_directory() as directory:
+            for name in ['sub/pkg/a.py', 'sub/pkg/build/b.py',
+                         'sub/pkg/generated.py', 'sub/pkg/local.py',
+                         'sub/pkg/other/generated.py', 'local.py']:
+                path = os.path.join(directory, *name.split('/'))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w') as output_file:
+                    output_file.write('# x = 1\n')
+            os.makedirs(os.path.join(directory, '.git', 'info'))
+            with open(os.path.join(directory, '.git', 'info', 'exclude'),
+                      'w') as output_file:
+                output_file.write('local.py\n')
+            with open(os.path.join(directory, '.gitignore'),
+                      'w') as output_file:
+                output_file.write('build/\n/sub/pkg/generated.py\n')
+            with open(os.path.join(directory, 'sub', '.gitignore'),
+                      'w') as output_file:
+                output_file.write('!/pkg/other/\n')
+
+            top = os.path.relpath(os.path.join(directory, 'sub', 'pkg'))
+            self.assertEqual(
+                ['a.py', 'other/generated.py'],
+                [os.path.relpath(name, top).replace(os.sep, '/')
+                 for name in eradicate.find_files([top], True)])
+            self.assertEqual(
+                ['sub/pkg/a.py', 'sub/pkg/other/generated.py'],
+                [os.path.relpath(name, directory).replace(os.sep, '/')
+                 for name in eradicate.find_files([directory], True)])
+
     def test_in_place(self):
         with temporary_file("""\
 # x * 3 == False
@@ -548,6 +1080,321 @@ class SystemTests(unittest.TestCase):
 # x is a variable
 """, f.read())
 
+    @unittest.skipIf(sys.platform == 'win32', 'requires Unix permissions')
+    def test_in_place_keeps_mode(self):
+        with temporary_directory() as directory:
+            with temporary_file('# x = 1\n', directory=directory) as filename:
+                os.chmod(filename, 0o640)
+                eradicate.main(argv=['my_fake_program', '--in-place',
+                                     filename],
+                               standard_out=None,
+                               standard_error=None)
+                with open(filename) as f:
+                    self.assertEqual('', f.read())
+                self.assertEqual(0o640, os.stat(filename).st_mode & 0o777)
+                self.assertEqual([os.path.basename(filename)],
+                                 os.listdir(directory))
+
+    def test_in_place_without_change(self):
+        with temporary_file('# x is a variable\n') as filename:
+            os.utime(filename, ns=(0, 0))
+            eradicate.main(argv=['my_fake_program', '--in-place', filename],
+                           standard_out=None,
+                           standard_error=None)
+            self.assertEqual(0, os.stat(filename).st_mtime_ns)
+
+    def test_in_place_with_crash(self):
+        def crash(*_args, **_kwargs):
+            yield '# x is a variable\n'
+            raise KeyboardInterrupt
+
+        with temporary_directory() as directory:
+            with temporary_file("""\
+# x * 3 == False
+# x is a variable
+""", directory=directory) as filename:
+                with mock.patch.object(eradicate.Eradicator,
+                                       'filter_commented_out_code', crash):
+                    with self.assertRaises(KeyboardInterrupt):
+                        eradicate.main(argv=['my_fake_program', '--in-place',
+                                             filename],
+                                       standard_out=None,
+                                       standard_error=None)
+                with open(filename) as f:
+                    self.assertEqual("""\
+# x * 3 == False
+# x is a variable
+""", f.read())
+                self.assertEqual([os.path.basename(filename)],
+                                 os.listdir(directory))
+
+    def test_large_file(self):
+        for contents in [b'# x = 1\nx = 1\n',
+                         b'\xef\xbb\xbf# x = 1\r\ny = "\xc3\xa9"\r\n',
+                         b'# coding: latin-1\n# x = 1\ny = "\xe9"\n',
+                         b'y = "\xff"\n# x = 1\n',
+                         b'# x = 1\nif x:\n        y = 1\n    z = 2\n'
+                         b'w = "\xff"\n',
+                         b'x = 1\n# /// script\n# x = 1\n# ///\n# y = 2\n',
+                         b'x = 1 \\\n# x = 1\n# x = 2',
+                         b'# x is a variable\n']:
+            results = []
+            with temporary_file('') as filename:
+                # Read the file, then memory-map it.
+                for size in [len(contents) + 1, len(contents)]:
+                    with open(filename, 'wb') as output_file:
+                        output_file.write(contents)
+                    with mock.patch.object(eradicate.Eradicator,
+                                           'LARGE_FILE_SIZE', size):
+                        output_file = io.StringIO()
+                        eradicate.main(argv=['my_fake_program', filename],
+                                       standard_out=output_file,
+                                       standard_error=None)
+                        eradicate.main(argv=['my_fake_program', '-i',
+                                             filename],
+                                       standard_out=None,
+                                       standard_error=None)
+                    with open(filename, 'rb') as input_file:
+                        results.append((output_file.getvalue(),
+                                        input_file.read()))
+            self.assertEqual(results[0], results[1])
+
+    def test_acheck_paths(self):
+        async def check(paths, **kwargs):
+            return [result async for result in
+                    eradicate.Eradicator().acheck_paths(paths, **kwargs)]
+
+        with temporary_directory() as directory:
+            filenames = []
+            for number in range(5):
+                filename = os.path.join(directory, f'{number}.py')
+                with open(filename, 'w') as output_file:
+                    output_file.write(f'x = 1\n# x = {number}\n' * number)
+                filenames.append(filename)
+            missing = os.path.join(directory, 'missing.py')
+
+            expected = [
+                (filename, list(range(2, 2 * number + 1, 2)), None)
+                for number, filename in enumerate(filenames)]
+            results = asyncio.run(check(filenames + [missing],
+                                        concurrency=2))
+            self.assertEqual(expected, sorted(result for result in results
+                                              if result.error is None))
+            [error] = [result for result in results if result.error]
+            self.assertEqual((missing, []), error[:2])
+            self.assertIn('missing.py', error.error)
+
+            with concurrent.futures.ProcessPoolExecutor(2) as executor:
+                results = asyncio.run(check(filenames, executor=executor))
+            self.assertEqual(expected, sorted(results))
+
+    def test_format(self):
+        with temporary_file("""\
+# x * 3 == False
+# x is a variable
+#else:
+""") as filename:
+            outputs = {}
+            for output_format in ['lines', 'json', 'sarif']:
+                for jobs in ['1', '2']:
+                    output_file = io.StringIO()
+                    result = eradicate.main(
+                        argv=['my_fake_program', '-e', '--format',
+                              output_format,
+                              '-j', jobs, filename, filename + 'x'],
+                        standard_out=output_file,
+                        standard_error=io.StringIO())
+                    self.assertEqual(1, result)
+                    outputs[output_format, jobs] = output_file.getvalue()
+                self.assertEqual(outputs[output_format, '1'],
+                                 outputs[output_format, '2'])
+
+            self.assertEqual(f"""\
+{filename}:1: [compile] # x * 3 == False
+{filename}:3: [keyword] #else:
+""", outputs['lines', '1'])
+            self.assertEqual(
+                [{'filename': filename, 'line': 1, 'text': '# x * 3 == False',
+                  'decision': 'compile'},
+                 {'filename': filename, 'line': 3, 'text': '#else:',
+                  'decision': 'keyword'}],
+                [json.loads(line)
+                 for line in outputs['json', '1'].splitlines()])
+
+            [run] = json.loads(outputs['sarif', '1'])['runs']
+            self.assertEqual(
+                [(1, '# x * 3 == False'), (3, '#else:')],
+                [(result['locations'][0]['physicalLocation']['region']
+                  ['startLine'],
+                  result['locations'][0]['physicalLocation']['region']
+                  ['snippet']['text'])
+                 for result in run['results']])
+
+        output_file = io.StringIO()
+        eradicate.main(argv=['my_fake_program', '--format', 'sarif', '-'],
+                       standard_out=output_file,
+                       standard_error=None,
+                       standard_input=io.StringIO('x = 1\n'))
+        self.assertEqual([], json.loads(output_file.getvalue())['runs'][0]
+                         ['results'])
+
+    def test_standard_input(self):
+        output_file = io.StringIO()
+        result = eradicate.main(argv=['my_fake_program', '-e', '-'],
+                                standard_out=output_file,
+                                standard_error=None,
+                                standard_input=io.StringIO("""\
+# x * 3 == False
+# x is a variable
+"""))
+        self.assertEqual(1, result)
+        self.assertEqual("""\
+--- before/stdin
++++ after/stdin
+@@ -1,2 +1 @@
+-# x * 3 == False
+ # x is a variable
+""", output_file.getvalue())
+
+    def test_standard_input_in_place(self):
+        output_file = io.StringIO()
+        result = eradicate.main(argv=['my_fake_program', '-e', '-i', '-'],
+                                standard_out=output_file,
+                                standard_error=None,
+                                standard_input=io.StringIO("""\
+# x * 3 == False
+# x is a variable
+"""))
+        self.assertEqual(1, result)
+        self.assertEqual("""\
+# x is a variable
+""", output_file.getvalue())
+
+    def test_standard_input_in_place_without_change(self):
+        output_file = io.StringIO()
+        result = eradicate.main(argv=['my_fake_program', '-e', '-i', '-'],
+                                standard_out=output_file,
+                                standard_error=None,
+                                standard_input=io.StringIO("""\
+# x is a variable
+x = 1"""))
+        self.assertIsNone(result)
+        self.assertEqual("""\
+# x is a variable
+x = 1""", output_file.getvalue())
+
+    def test_standard_input_with_coding(self):
+        source = """\
+# -*- coding: latin-1 -*-
+# Le caf\xe9 est pr\xeat.
+# x = 'caf\xe9'
+x = 1\r
+""".encode('latin-1')
+        outputs = []
+        for arguments in [['-'], ['-i', '-']]:
+            output_file = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+            result = eradicate.main(
+                argv=['my_fake_program', '-e', *arguments],
+                standard_out=output_file,
+                standard_error=None,
+                standard_input=io.TextIOWrapper(io.BytesIO(source),
+                                                encoding='utf-8'))
+            self.assertEqual(1, result)
+            output_file.flush()
+            outputs.append(output_file.buffer.getvalue())
+        self.assertIn("-# x = 'caf\xe9'\n".encode(), outputs[0])
+        self.assertEqual(source.replace(b"# x = 'caf\xe9'\n", b''),
+                         outputs[1])
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'requires Unix sockets')
+    def test_server(self):
+        with temporary_directory() as directory:
+            path = os.path.join(directory, 'socket')
+            server = eradicate.create_server(path)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                with temporary_file("""\
+# x * 3 == False
+# x is a variable
+""") as filename:
+                    output_file = io.StringIO()
+                    result = eradicate.main(argv=['my_fake_program',
+                                                  '--connect', path,
+                                                  '-e', filename],
+                                            standard_out=output_file,
+                                            standard_error=None)
+                    self.assertEqual(1, result)
+                    self.assertEqual("""\
+@@ -1,2 +1 @@
+-# x * 3 == False
+ # x is a variable
+""", '\n'.join(output_file.getvalue().split('\n')[2:]))
+
+                    eradicator = server.service.eradicator
+                    eradicate.main(argv=['my_fake_program', '--connect', path,
+                                         filename],
+                                   standard_out=io.StringIO(),
+                                   standard_error=None)
+                    self.assertIs(eradicator, server.service.eradicator)
+
+                    output_file = io.StringIO()
+                    result = eradicate.main(argv=['my_fake_program',
+                                                  '--connect', path,
+                                                  '--whitelist-extend', 'x',
+                                                  '-e', filename],
+                                            standard_out=output_file,
+                                            standard_error=None)
+                    self.assertIsNone(result)
+                    self.assertEqual('', output_file.getvalue())
+                    self.assertIsNot(eradicator, server.service.eradicator)
+
+                output_file = io.StringIO()
+                result = eradicate.main(argv=['my_fake_program', '--connect',
+                                              path, '-i', '-'],
+                                        standard_out=output_file,
+                                        standard_error=None,
+                                        standard_input=io.StringIO(
+                                            '# x = 1\ny = 2\n'))
+                self.assertIsNone(result)
+                self.assertEqual('y = 2\n', output_file.getvalue())
+            finally:
+                server.shutdown()
+                thread.join()
+                server.server_close()
+
+    def test_server_with_error(self):
+        with temporary_directory() as directory:
+            response = eradicate.EradicatorService().run(
+                {'argv': ['my_fake_program', '.'],
+                 'cwd': os.path.join(directory, 'missing'),
+                 'stdin': None})
+        self.assertEqual(1, response['returncode'])
+        self.assertIn('FileNotFoundError', response['stderr'])
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'requires Unix sockets')
+    def test_connect_without_response(self):
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.rfile.readline()
+
+        with temporary_directory() as directory:
+            path = os.path.join(directory, 'socket')
+            server = socketserver.UnixStreamServer(path, Handler)
+            thread = threading.Thread(target=server.handle_request)
+            thread.start()
+            try:
+                error_file = io.StringIO()
+                result = eradicate.main(argv=['my_fake_program', '--connect',
+                                              path, '.'],
+                                        standard_out=io.StringIO(),
+                                        standard_error=error_file)
+            finally:
+                thread.join()
+                server.server_close()
+        self.assertEqual(1, result)
+        self.assertIn('no response from server', error_file.getvalue())
+
     def test_with_missing_file(self):
         output_file = io.StringIO()
         ignore = StubFile()
@@ -585,6 +1432,9 @@ class SystemTests(unittest.TestCase):
 """) as filename:
             process = subprocess.Popen([sys.executable, '-m'
                                         'eradicate', filename],
+                                       env=dict(os.environ, PYTHONPATH=(
+                                           os.path.dirname(os.path.abspath(
+                                               eradicate.__file__)))),
                                        stdout=subprocess.PIPE,
                                        stderr=subprocess.PIPE,
                                        universal_newlines=True)
@@ -596,6 +1446,148 @@ class SystemTests(unittest.TestCase):
             '\n'.join(out.splitlines()[2:]))
             self.assertEqual(err, '')
 
+    def test_diff_base(self):
+        def git(*arguments):
+            subprocess.run(['git', '-c', 'user.name=eradicate',
+                            '-c', 'user.email=eradicate@example.com',
+                            *arguments],
+                           check=True, capture_output=True)
+
+        directory = os.getcwd()
+        with temporary_directory() as repository:
+            os.chdir(repository)
+            try:
+                git('init', '-q')
+                with open('changed.py', 'w') as output_file:
+                    output_file.write('# x = 1\nx = 1\n')
+                with open('unchanged.py', 'w') as output_file:
+                    output_file.write('# x = 1\n')
+                git('add', '.')
+                git('commit', '-q', '-m', 'Initial')
+
+                with open('changed.py', 'w') as output_file:
+                    output_file.write('# x = 1\nx = 1\n# y = 2\n')
+                with open('new.py', 'w') as output_file:
+                    output_file.write('# z = 3\n')
+
+                read_with_encoding = eradicate.Eradicator.read_with_encoding
+                with mock.patch.object(eradicate.Eradicator,
+                                       'read_with_encoding', autospec=True,
+                                       side_effect=read_with_encoding) as read:
+                    output_file = io.StringIO()
+                    eradicate.main(argv=['my_fake_program', '--diff-base',
+                                         'HEAD'],
+                                   standard_out=output_file,
+                                   standard_error=None)
+                self.assertEqual(['changed.py', 'new.py'],
+                                 sorted(call.args[1]
+                                        for call in read.call_args_list))
+                self.assertIn('-# x = 1', output_file.getvalue())
+                self.assertIn('-# y = 2', output_file.getvalue())
+                self.assertIn('-# z = 3', output_file.getvalue())
+
+                output_file = io.StringIO()
+                eradicate.main(argv=['my_fake_program', '--diff-base', 'HEAD',
+                                     '--only-changed-lines', 'changed.py'],
+                               standard_out=output_file,
+                               standard_error=None)
+                self.assertEqual("""\
+--- before/changed.py
++++ after/changed.py
+@@ -1,3 +1,2 @@
+ # x = 1
+ x = 1
+-# y = 2
+""", output_file.getvalue())
+
+                error_file = io.StringIO()
+                self.assertEqual(1, eradicate.main(
+                    argv=['my_fake_program', '--diff-base', 'no-such-ref'],
+                    standard_out=io.StringIO(),
+                    standard_error=error_file))
+                self.assertIn('no-such-ref', error_file.getvalue())
+
+                # Files are found in the whole work tree, relative to the
+                # current directory.
+                os.mkdir('sub')
+                with open(os.path.join('sub', 'other.py'),
+                          'w') as output_file:
+                    output_file.write('# w = 4\n')
+                os.chdir('sub')
+                self.assertEqual(
+                    {os.path.join(os.pardir, 'changed.py'): {3},
+                     os.path.join(os.pardir, 'new.py'): None,
+                     'other.py': None},
+                    eradicate.git_changed_lines('HEAD'))
+                self.assertEqual({'other.py': None},
+                                 eradicate.git_changed_lines('HEAD', ['.']))
+            finally:
+                os.chdir(directory)
+
+    def test_skip_index(self):
+        def check(*arguments):
+            read_with_encoding = eradicate.Eradicator.read_with_encoding
+            with mock.patch.object(eradicate.Eradicator,
+                                   'read_with_encoding', autospec=True,
+                                   side_effect=read_with_encoding) as read:
+                output_file = io.StringIO()
+                eradicate.main(argv=['my_fake_program', *arguments],
+                               standard_out=output_file,
+                               standard_error=None)
+            return (sorted(call.args[1] for call in read.call_args_list),
+                    output_file.getvalue())
+
+        directory = os.getcwd()
+        with temporary_directory() as repository:
+            os.chdir(repository)
+            try:
+                subprocess.run(['git', 'init', '-q'], check=True)
+                for name, source in [('clean.py', 'x = 1\n'),
+                                     ('code.py', '# x = 1\n'),
+                                     ('racy.py', 'y = 1\n')]:
+                    with open(name, 'w') as output_file:
+                        output_file.write(source)
+                    if name != 'racy.py':
+                        os.utime(name, ns=(0, 0))
+                names = ['clean.py', 'code.py', 'racy.py']
+                index = os.path.join('.git', 'eradicate-index')
+
+                # Nothing is recorded for standard input.
+                eradicate.main(argv=['my_fake_program', '-'],
+                               standard_out=io.StringIO(),
+                               standard_error=None,
+                               standard_input=io.StringIO('# x = 1\n'))
+                self.assertFalse(os.path.exists(index))
+
+                reads, output = check(*names)
+                self.assertEqual(names, reads)
+                self.assertIn('-# x = 1', output)
+                self.assertTrue(os.path.exists(index))
+
+                # The index is not written again if no entry changed.
+                inode = os.stat(index).st_ino
+                self.assertEqual((['code.py', 'racy.py'], output),
+                                 check(*names))
+                self.assertEqual(inode, os.stat(index).st_ino)
+                self.assertEqual((names, output), check('--no-index', *names))
+                self.assertEqual(names, check('--aggressive', *names)[0])
+                self.assertEqual(['code.py', 'racy.py'],
+                                 check('--aggressive', *names)[0])
+                with mock.patch.object(sys.implementation, 'cache_tag',
+                                       'other-interpreter'):
+                    self.assertEqual(names,
+                                     check('--aggressive', *names)[0])
+
+                with open('clean.py', 'w') as output_file:
+                    output_file.write('# y = 2\n')
+                os.utime('clean.py', ns=(0, 0))
+                check('--aggressive', *names)
+                reads, output = check('--aggressive', *names)
+                self.assertEqual(names, reads)
+                self.assertIn('-# y = 2', output)
+            finally:
+                os.chdir(directory)
+
     def test_whitelist(self):
         mock_update = mock.Mock()
         with mock.patch.object(eradicate.Eradicator, 'update_whitelist', mock_update):